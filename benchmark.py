@@ -0,0 +1,302 @@
+"""
+Reproducible benchmark suite for the checkers solver.
+
+Runs move generation, evaluation, fixed-depth alpha-beta searches, time-to-depth
+searches and full checkers_solve games over a fixed set of positions, and prints
+the results as JSON. Save the output of two commits and diff them, or pass the
+older file with --compare to print the change of every timing.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import checkers
+
+
+# Each position is a board grid plus the side to move. Games are only played from
+# positions known to finish at the default depth.
+positions = {
+    'opening': {
+        'grid': checkers.opening_grid,
+        'red_turn': True,
+        'game': False,
+    },
+    'opening_developed': {
+        'grid': ['.b.b.b.b',
+                 'b.b.b.b.',
+                 '.b...b.b',
+                 '..b.....',
+                 '...r....',
+                 'r...r.r.',
+                 '.r.r.r.r',
+                 'r.r.r.r.'],
+        'red_turn': True,
+        'game': False,
+    },
+    'mid_material': {
+        'grid': ['.......B',
+                 '..r.....',
+                 '.b...b..',
+                 '......r.',
+                 '.....R..',
+                 'b.B.....',
+                 '.r.b....',
+                 '..r.....'],
+        'red_turn': True,
+        'game': False,
+    },
+    'king_endgame': {
+        'grid': ['........',
+                 '..R.....',
+                 '.....R..',
+                 '........',
+                 '.B......',
+                 '......B.',
+                 '...B....',
+                 'R.......'],
+        'red_turn': True,
+        'game': False,
+    },
+    'king_endgame_small': {
+        'grid': ['........',
+                 '........',
+                 '...R....',
+                 '........',
+                 '.....R..',
+                 '........',
+                 '.B......',
+                 '........'],
+        'red_turn': True,
+        'game': True,
+    },
+    'multi_jump': {
+        'grid': ['.......B',
+                 '........',
+                 '.....b..',
+                 '........',
+                 '.b.b....',
+                 '........',
+                 '.b......',
+                 'r.....R.'],
+        'red_turn': True,
+        'game': False,
+    },
+    'short_game': {
+        'grid': ['........',
+                 '....b...',
+                 '.......R',
+                 '..b.b...',
+                 '...b...r',
+                 '........',
+                 '...r....',
+                 '....B...'],
+        'red_turn': True,
+        'game': True,
+    },
+}
+
+
+def make_state(position):
+    return checkers.State(checkers.read_from_input(position['grid']), position['red_turn'])
+
+
+def bench_move_finder(state, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        moves = state.move_finder()[0]
+    seconds = time.perf_counter() - start
+    return {'calls_per_second': iterations / seconds,
+            'moves_per_second': iterations * len(moves) / seconds,
+            'moves': len(moves)}
+
+
+def bench_evaluation(board, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        board.evaluation_fcn()
+    seconds = time.perf_counter() - start
+    return {'calls_per_second': iterations / seconds}
+
+
+def bench_batch_evaluation(state, iterations):
+    """
+    Times evaluate_batch on the children of a position, as the frontier batch mode
+    of the search calls it.
+    """
+    positions = []
+    for move in state.move_finder()[0]:
+        board = state.board.copy()
+        board.make(move)
+        positions.append((board.red_men, board.red_kings, board.black_men, board.black_kings))
+    start = time.perf_counter()
+    for i in range(iterations):
+        checkers.evaluate_batch(positions)
+    seconds = time.perf_counter() - start
+    return {'positions_per_second': iterations * len(positions) / seconds,
+            'batch_size': len(positions), 'numpy': checkers.numpy is not None}
+
+
+def bench_search(state, depth, repeat):
+    """
+    Runs the same fixed-depth search several times, each from an empty
+    transposition table, evaluation cache and move history.
+
+    :return: Best time, nodes, nodes/sec and whether every run chose the same move.
+    :rtype: Dict
+    """
+    checkers.depth_limit = depth
+    times = []
+    chosen = set()
+    for i in range(repeat):
+        checkers.clear_search_tables()
+        nodes_before = checkers.search_control.nodes
+        start = time.perf_counter()
+        next_state = state.alpha_beta_prune()
+        times.append(time.perf_counter() - start)
+        nodes = checkers.search_control.nodes - nodes_before
+        chosen.add(''.join(''.join(row) for row in next_state.board.grid))
+    seconds = min(times)
+    return {'seconds': seconds, 'nodes': nodes, 'nodes_per_second': nodes / seconds if seconds > 0 else None,
+            'stable': len(chosen) == 1}
+
+
+def bench_time_to_depth(state, max_depth):
+    """
+    Deepens one ply at a time, as iterative deepening does, and records the
+    cumulative time and nodes needed to finish each depth, starting from empty
+    search tables.
+
+    :rtype: List[Dict]
+    """
+    checkers.clear_search_tables()
+    search_state = checkers.State(state.board.copy(), state.red_turn)
+    control = checkers.search_control
+    control.root_move = None
+    nodes_before = control.nodes
+    start = time.perf_counter()
+    reached = []
+    for limit in range(2, max_depth + 2):
+        control.depth_limit = limit
+        control.start_search(search_state)
+        if state.red_turn:
+            (move, value) = search_state.MAX_VALUE(float('-inf'), float('inf'), 1)
+        else:
+            (move, value) = search_state.MIN_VALUE(float('-inf'), float('inf'), 1)
+        control.root_move = move.key
+        reached.append({'depth': limit - 1, 'seconds': time.perf_counter() - start,
+                        'nodes': control.nodes - nodes_before})
+    control.root_move = None
+    return reached
+
+
+def bench_game(state, depth):
+    checkers.depth_limit = depth
+    output = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+    output.close()
+    nodes_before = checkers.search_control.nodes
+    start = time.perf_counter()
+    final_state = checkers.checkers_solve(state, output.name)
+    seconds = time.perf_counter() - start
+    os.unlink(output.name)
+    return {'seconds': seconds, 'nodes': checkers.search_control.nodes - nodes_before, 'plies': final_state.plies}
+
+
+def run_suite(depth, max_depth, repeat, iterations, names=None):
+    """
+    Runs every benchmark over the chosen positions.
+
+    :param depth: The depth limit of the fixed-depth searches and the games.
+    :type depth: int
+    :param max_depth: The deepest ply of the time-to-depth runs.
+    :type max_depth: int
+    :param repeat: How many times each fixed-depth search is repeated.
+    :type repeat: int
+    :param iterations: How many calls are timed for move generation and evaluation.
+    :type iterations: int
+    :param names: The positions to run, or None for all of them.
+    :type names: Optional[List[str]]
+    :rtype: Dict
+    """
+    results = {
+        'python': platform.python_version(),
+        'depth': depth,
+        'max_depth': max_depth,
+        'positions': {},
+    }
+    default_depth = checkers.depth_limit
+    for name in names or sorted(positions):
+        position = positions[name]
+        state = make_state(position)
+        checkers.clear_search_tables()
+        result = {
+            'move_finder': bench_move_finder(state, iterations),
+            'evaluation': bench_evaluation(state.board, iterations),
+            'batch_evaluation': bench_batch_evaluation(state, iterations),
+            'search': bench_search(state, depth, repeat),
+            'time_to_depth': bench_time_to_depth(state, max_depth),
+        }
+        if position['game']:
+            result['game'] = bench_game(make_state(position), depth)
+        checkers.depth_limit = default_depth
+        results['positions'][name] = result
+    results['peak_rss_kb'] = checkers.peak_rss_kb()
+    return results
+
+
+def compare(old, new):
+    """
+    Prints the ratio new / old of the main timings of two benchmark results.
+    Ratios above 1 for seconds, or below 1 for rates, are slowdowns.
+    """
+    for name in sorted(new['positions']):
+        if name not in old['positions']:
+            continue
+        (before, after) = (old['positions'][name], new['positions'][name])
+        rows = [
+            ('move_finder calls/s', before['move_finder']['calls_per_second'], after['move_finder']['calls_per_second']),
+            ('evaluation calls/s', before['evaluation']['calls_per_second'], after['evaluation']['calls_per_second']),
+            ('search seconds', before['search']['seconds'], after['search']['seconds']),
+            ('search nodes', before['search']['nodes'], after['search']['nodes']),
+        ]
+        if 'game' in before and 'game' in after:
+            rows.append(('game seconds', before['game']['seconds'], after['game']['seconds']))
+        for (label, old_value, new_value) in rows:
+            ratio = new_value / old_value if old_value else float('nan')
+            print('{:20s} {:22s} {:12.4g} -> {:12.4g}  x{:.3f}'.format(name, label, old_value, new_value, ratio))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the checkers solver.")
+    parser.add_argument("--depth", type=int, default=checkers.depth_limit,
+                        help="Depth limit of the fixed-depth searches and the games.")
+    parser.add_argument("--max-depth", type=int, default=10,
+                        help="Deepest ply of the time-to-depth runs.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="How many times each fixed-depth search is repeated.")
+    parser.add_argument("--iterations", type=int, default=2000,
+                        help="How many calls are timed for move generation and evaluation.")
+    parser.add_argument("--positions", type=str, nargs="*", default=None, choices=sorted(positions),
+                        help="Run only these positions.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Earlier JSON results to compare the new results with.")
+    args = parser.parse_args()
+
+    results = run_suite(args.depth, args.max_depth, args.repeat, args.iterations, args.positions)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        output_file = open(args.output, "w")
+        output_file.write(text + "\n")
+        output_file.close()
+    if args.compare is not None:
+        compare_file = open(args.compare, "r")
+        compare(json.load(compare_file), results)
+        compare_file.close()
@@ -0,0 +1,185 @@
+"""
+Position book generator for the checkers solver.
+
+Searches a corpus of positions deeply, offline, and writes the best move of each
+to a file that checkers.py memory-maps and consults before searching a move (see
+--book). The corpus is every position reached within a number of plies of the
+standard opening, plus the positions of any puzzle files and packed position files
+(see positions.py) given. Both sides to
+move are covered, and positions with a single legal move are left out as the
+solver plays those without searching.
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import checkers
+
+
+def opening_positions(plies):
+    """
+    Lists every position reached within a number of plies of the standard opening.
+
+    :param plies: The number of plies to expand.
+    :type plies: int
+    :return: Tuples (red_men, red_kings, black_men, black_kings, red_turn), without repeats.
+    :rtype: List[Tuple[int, int, int, int, bool]]
+    """
+    board = checkers.read_from_input(checkers.opening_grid)
+    frontier = [(board.red_men, board.red_kings, board.black_men, board.black_kings, True)]
+    positions = list(frontier)
+    seen = set(frontier)
+    for ply in range(plies):
+        next_frontier = []
+        for position in frontier:
+            board = checkers.Board((), *position[:4])
+            for move in board.generate_moves(position[4])[0]:
+                board.make(move)
+                child = (board.red_men, board.red_kings, board.black_men, board.black_kings, not position[4])
+                board.unmake(move)
+                if child not in seen:
+                    seen.add(child)
+                    next_frontier.append(child)
+        positions.extend(next_frontier)
+        frontier = next_frontier
+    return positions
+
+
+def puzzle_positions(paths):
+    """
+    :param paths: Puzzle files in the read_from_file format, red to move.
+    :type paths: List[str]
+    :rtype: List[Tuple[int, int, int, int, bool]]
+    """
+    positions = []
+    for path in paths:
+        board = checkers.read_from_file(path)
+        positions.append((board.red_men, board.red_kings, board.black_men, board.black_kings, True))
+    return positions
+
+
+def packed_positions(paths):
+    """
+    :param paths: Packed position files (see positions.py).
+    :type paths: List[str]
+    :rtype: List[Tuple[int, int, int, int, bool]]
+    """
+    positions = []
+    for path in paths:
+        positions.extend(position[:4] + (bool(position[4]),) for position in checkers.read_positions(path))
+    return positions
+
+
+def init_book_worker(depth):
+    checkers.depth_limit = depth
+
+
+def search_position(position):
+    """
+    Searches one position to checkers.depth_limit.
+
+    :param position: (red_men, red_kings, black_men, black_kings, red_turn)
+    :type position: Tuple[int, int, int, int, bool]
+    :return: The book record of the position, or None if it has fewer than two moves.
+    :rtype: Optional[Tuple[int, int, int]]
+    """
+    board = checkers.Board((), *position[:4])
+    state = checkers.State(board, position[4])
+    if board.pieces_check_end_game() or len(state.move_finder()[0]) < 2:
+        return None
+    move = state.iterative_deepening()
+    return (board.position_key(position[4]), move.key, checkers.depth_limit - 1)
+
+
+def build_book(positions, depth, filename, workers=1, verbose=False):
+    """
+    Searches every position and writes the book.
+
+    :param positions: The positions to search.
+    :type positions: List[Tuple[int, int, int, int, bool]]
+    :param depth: The depth limit of the searches (see checkers.depth_limit).
+    :type depth: int
+    :param filename: The book file to write.
+    :type filename: str
+    :param workers: The number of worker processes.
+    :type workers: int
+    :param verbose: Print the progress every 100 positions.
+    :type verbose: bool
+    :return: The number of positions in the book.
+    :rtype: int
+    """
+    start = time.perf_counter()
+    records = {}
+    pool = multiprocessing.Pool(workers, init_book_worker, (depth,)) if workers > 1 else None
+    try:
+        if pool is not None:
+            results = pool.imap_unordered(search_position, positions, chunksize=4)
+        else:
+            init_book_worker(depth)
+            results = map(search_position, positions)
+        for done, record in enumerate(results, 1):
+            if record is not None:
+                records[record[0]] = record
+            if verbose and done % 100 == 0:
+                print('{}/{} positions {:.1f}s'.format(done, len(positions), time.perf_counter() - start))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    checkers.write_sorted_records(filename, checkers.Book.magic, checkers.Book.record, depth, list(records.values()))
+    return len(records)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build a position book for checkers.py.")
+    parser.add_argument(
+        "--plies",
+        type=int,
+        default=3,
+        help="Include every position within this many plies of the standard opening."
+    )
+    parser.add_argument(
+        "--puzzles",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Puzzle files whose positions are included too (red to move)."
+    )
+    parser.add_argument(
+        "--positions",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Packed position files (see positions.py) whose positions are included too."
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=12,
+        help="Depth limit of the search of each position."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes searching positions side by side."
+    )
+    parser.add_argument(
+        "--tt-mb",
+        type=float,
+        default=checkers.tt_size_mb,
+        help="Memory cap of the transposition table of each process in megabytes."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="The book file to write."
+    )
+    args = parser.parse_args()
+
+    checkers.transposition_table = checkers.TranspositionTable(args.tt_mb)
+    positions = opening_positions(args.plies) + puzzle_positions(args.puzzles) + packed_positions(args.positions)
+    print(build_book(positions, args.depth, args.output, args.workers, verbose=True))
@@ -1,7 +1,25 @@
-from copy import deepcopy
 from heapq import heappush, heappop
-import heapq  
 import argparse
+import glob
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+import warnings
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, evaluate_batch falls back to lookup tables
+    numpy = None
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
 
 #====================================================================================
 depth_limit = 8
@@ -17,26 +35,128 @@ stalemate = False
 centre_slots = [(2,3), (3,4), (4,3), (5,4)]
 utility = float('inf')
 neg_utility = float('-inf')
+tt_size_mb = 64 # Memory cap of the transposition table
+eval_cache_mb = 16 # Memory cap of the cache of leaf values
+memory_limit_mb = None # Resident memory the process should stay within by shrinking its caches; None for no limit
+memory_reserve_mb = 32 # Memory kept free of the caches for the search itself under memory_limit_mb
+memory_processes = 1 # Processes sharing memory_limit_mb equally: this one and the parallel search workers
+move_time_ms = None # Wall-clock budget per move; None searches to depth_limit
+game_time_ms = None # Wall-clock budget for the whole game; None for no limit
+game_time_share = 20 # A move may use at most this fraction (1/n) of the game time left
+max_search_depth = 64 # Deepest iteration tried when searching under a time budget
+move_node_limit = None # Node budget per move; the search deepens until it is spent. None for no limit
+no_progress_limit = 80 # Plies without a capture or a basic piece moving after which the game is drawn
+repetitions_for_draw = 3 # The game is drawn when the same position occurs this many times
+draw_value = 0 # Value of a drawn position
+parallel_workers = 1 # Number of processes searching the root moves of each position
+static_ordering = False # Order moves by the evaluation of their children instead of killers and history
+batch_evaluation = False # Evaluate all the quiet children of a frontier node with one evaluate_batch call
+quiescence_search = True # Keep searching pending jumps beyond the depth limit before evaluating
+selective_search = True # Reduce and prune late quiet moves; False for an exact full-width search
+late_move_count = 3 # Moves of a node searched to full depth before later quiet moves are reduced
+late_move_draft = 3 # Remaining depth a node needs for its late moves to be reduced by a ply
+futility_margin = 0.5 # Points a quiet move near the leaves may gain over its evaluation; None to not prune
+futility_draft = 2 # Remaining depth up to which quiet moves are pruned by futility_margin
+aspiration_window = 0.15 # Half-width of the root window around the expected value of an iteration
+
+#====================================================================================
+# Bitboard layout: only the 32 dark squares are playable. They are numbered 0-31
+# row by row from the top of the board, four per row, so square n lies on row n // 4.
+# On even rows the dark squares are the odd columns and on odd rows the even ones.
+num_squares = 32
+
+
+def square_index(x_coord, y_coord):
+    """
+    Maps the coordinates of a dark square to its bitboard index.
+
+    :param x_coord: The column of the square.
+    :type x_coord: int
+    :param y_coord: The row of the square.
+    :type y_coord: int
+    :return: The index (0-31) of the square.
+    :rtype: int
+    """
+    return y_coord * 4 + x_coord // 2
+
+
+def square_coord(square):
+    """
+    Maps a bitboard index back to the (x, y) coordinates of its dark square.
+
+    :param square: The index (0-31) of the square.
+    :type square: int
+    :return: The coordinates of the square.
+    :rtype: Tuple[int, int]
+    """
+    y_coord = square // 4
+    x_coord = 2 * (square % 4) + (1 - y_coord % 2)
+    return (x_coord, y_coord)
+
+
+square_coords = [square_coord(square) for square in range(num_squares)]
+
+
+def bit_squares(mask):
+    """
+    Yields the index of every set bit of a bitboard, lowest first.
+
+    :param mask: The bitboard to scan.
+    :type mask: int
+    """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+#====================================================================================
+# Zobrist hashing: every (piece kind, square) pair has a fixed random 64-bit key and a
+# position hashes to the XOR of the keys of its pieces. The generator is seeded so that
+# the keys, and therefore the hashes, are identical in every run.
+red_men_kind = 0
+red_kings_kind = 1
+black_men_kind = 2
+black_kings_kind = 3
+king_kinds = (red_kings_kind, black_kings_kind)
+zobrist_random = random.Random(20240229)
+zobrist_keys = [[zobrist_random.getrandbits(64) for square in range(num_squares)] for kind in range(4)]
+zobrist_red_turn = zobrist_random.getrandbits(64)
+
+
+def zobrist_hash(mask, kind):
+    """
+    Returns the XOR of the Zobrist keys of every square in a bitboard.
+
+    :param mask: The bitboard of one kind of piece.
+    :type mask: int
+    :param kind: The piece kind (one of red_men_kind, red_kings_kind, black_men_kind, black_kings_kind).
+    :type kind: int
+    :rtype: int
+    """
+    key = 0
+    for square in bit_squares(mask):
+        key ^= zobrist_keys[kind][square]
+    return key
 
 
 class Piece:
     """
-    This represents a piece on the Hua Rong Dao puzzle.
+    This represents a single checker on the board.
     """
 
+    __slots__ = ('is_red', 'is_king', 'coord_x', 'coord_y')
+
     def __init__(self, is_red, is_king, coord_x, coord_y):
         """
-        :param is_goal: True if the piece is the goal piece and False otherwise.
-        :type is_goal: bool
-        :param is_single: True if this piece is a 1x1 piece and False otherwise.
-        :type is_single: bool
-        :param coord_x: The x coordinate of the top left corner of the piece.
+        :param is_red: True if the piece belongs to the red player and False otherwise.
+        :type is_red: bool
+        :param is_king: True if the piece is a king and False otherwise.
+        :type is_king: bool
+        :param coord_x: The x coordinate of the piece.
         :type coord_x: int
-        :param coord_y: The y coordinate of the top left corner of the piece.
+        :param coord_y: The y coordinate of the piece.
         :type coord_y: int
-        :param orientation: The orientation of the piece (one of 'h' or 'v') 
-            if the piece is a 1x2 piece. Otherwise, this is None
-        :type orientation: str
         """
 
         self.is_red = is_red
@@ -48,53 +168,474 @@ class Piece:
         return '{} {} {} {}'.format(self.is_red, self.is_king, \
             self.coord_x, self.coord_y)
 
+#====================================================================================
+# Evaluation weights. They are kept in units of 1/1400 of a point, so that every term
+# is a whole number and a board can keep a running total of its evaluation that is
+# updated exactly as moves are made and taken back.
+score_scale = 1400
+piece_score = 1400 # 1 point for every piece
+king_score = 2100 # 1.5 points for a king
+advancement_score = 100 # 1/14 of a point per row a basic piece has advanced
+centre_score = 350 # 0.25 points for a piece in one of the centre slots
+edge_score = 14 # 0.01 points for a piece touching an edge, as it cannot be captured
+home_score = 350 # 0.25 points for a piece on the home line
+null_window = 0.5 / score_scale # Narrower than the smallest difference between two evaluations
+
+
+def piece_square_score(kind, square):
+    """
+    Returns the contribution of one piece to the evaluation, in score_scale units.
+    Red pieces count positively and black pieces negatively.
+
+    :param kind: The piece kind.
+    :type kind: int
+    :param square: The square (0-31) of the piece.
+    :type square: int
+    :rtype: int
+    """
+    (coord_x, coord_y) = square_coords[square]
+    score = 0
+    if (coord_x, coord_y) in centre_slots:
+        score += centre_score
+    if kind < black_men_kind:
+        if kind == red_kings_kind:
+            score += king_score
+        else:
+            score += piece_score + advancement_score * (7 - coord_y)
+        if coord_x == 0 or coord_y == 0 or coord_x == 7:
+            score += edge_score
+        if coord_x == 7:
+            score += home_score
+        return score
+    if kind == black_kings_kind:
+        score += king_score
+    else:
+        score += piece_score + advancement_score * coord_y
+    if coord_x == 7 or coord_y == 0:
+        score += edge_score
+    if coord_x == 0:
+        score += home_score
+    return -score
+
+
+piece_square_scores = [[piece_square_score(kind, square) for square in range(num_squares)] for kind in range(4)]
+
+
+def mask_score(mask, kind):
+    """
+    Returns the evaluation of every piece of one kind in a bitboard, in score_scale units.
+
+    :rtype: int
+    """
+    score = 0
+    for square in bit_squares(mask):
+        score += piece_square_scores[kind][square]
+    return score
+
+
+# Batch evaluation. Without NumPy each 32-bit mask is scored a byte at a time from
+# tables giving the score of every possible byte of pieces of each kind.
+def build_byte_scores():
+    """
+    :return: The summed piece-square scores of every byte of a piece mask, by kind
+        and byte index (see evaluate_batch).
+    :rtype: List[List[List[int]]]
+    """
+    tables = []
+    for kind in range(4):
+        kind_tables = []
+        for byte_index in range(4):
+            scores = [0] * 256
+            for byte in range(1, 256):
+                # The lowest set bit plus the byte without it, which is already summed.
+                low = (byte & -byte).bit_length() - 1
+                scores[byte] = scores[byte & (byte - 1)] + piece_square_scores[kind][8 * byte_index + low]
+            kind_tables.append(scores)
+        tables.append(kind_tables)
+    return tables
+
+
+byte_scores = build_byte_scores()
+if numpy is not None:
+    square_weights = numpy.array(piece_square_scores, dtype=numpy.int64) # Shape (kind, square)
+    square_shifts = numpy.arange(num_squares, dtype=numpy.uint32)
+
+
+def end_value(masks):
+    """
+    :return: The value of a position where a side has no pieces left, as in Board.evaluation_fcn.
+    :rtype: float
+    """
+    if not (masks[0] | masks[1]):
+        return float('-inf')
+    return float('inf')
+
+
+def evaluate_batch(positions):
+    """
+    Evaluates many positions with one call, giving the same values as
+    Board.evaluation_fcn. With NumPy the masks are expanded into an array of
+    squares and multiplied with the piece-square weights of every kind at once.
+
+    :param positions: The (red_men, red_kings, black_men, black_kings) masks of each position.
+    :type positions: List[Tuple[int, int, int, int]]
+    :return: The evaluation of each position.
+    :rtype: List[float]
+    """
+    if len(positions) == 0:
+        return []
+    if numpy is not None:
+        masks = numpy.array(positions, dtype=numpy.uint32) # Shape (position, kind)
+        squares = (masks[:, :, None] >> square_shifts) & 1 # Shape (position, kind, square)
+        scores = (squares * square_weights).sum(axis=(1, 2))
+        return [end_value(masks) if not (masks[0] | masks[1]) or not (masks[2] | masks[3]) else score / score_scale
+                for (masks, score) in zip(positions, scores.tolist())]
+    values = []
+    for masks in positions:
+        if not (masks[0] | masks[1]) or not (masks[2] | masks[3]):
+            values.append(end_value(masks))
+            continue
+        score = 0
+        for kind in range(4):
+            mask = masks[kind]
+            tables = byte_scores[kind]
+            score += tables[0][mask & 0xFF] + tables[1][mask >> 8 & 0xFF] \
+                + tables[2][mask >> 16 & 0xFF] + tables[3][mask >> 24]
+        values.append(score / score_scale)
+    return values
+
+
+class Move:
+    """
+    This represents one turn of one player: a simple move or a whole jump sequence.
+    A move is a small record of bit flips, so it can be applied to a board and
+    taken back again without copying the board.
+    """
+
+    __slots__ = ('red_turn', 'from_square', 'to_square', 'is_king', 'captured_men', 'captured_kings', 'promotion',
+                 'path', 'men_toggle', 'kings_toggle', 'hash_delta', 'key', 'captures', 'irreversible', 'score_delta')
+
+    def __init__(self, red_turn, from_square, to_square, is_king, captured_men=0, captured_kings=0,
+                 promotion=False, path=None):
+        """
+        :param red_turn: True if the move is made by the red player.
+        :type red_turn: bool
+        :param from_square: The square (0-31) the piece starts on.
+        :type from_square: int
+        :param to_square: The square (0-31) the piece finishes on.
+        :type to_square: int
+        :param is_king: True if the moving piece is already a king.
+        :type is_king: bool
+        :param captured_men: Bitboard of the basic pieces captured by the move.
+        :type captured_men: int
+        :param captured_kings: Bitboard of the kings captured by the move.
+        :type captured_kings: int
+        :param promotion: True if the moving piece becomes a king.
+        :type promotion: bool
+        :param path: The squares visited by the piece, starting with from_square.
+        :type path: Optional[Tuple[int]]
+        """
+
+        self.red_turn = red_turn
+        self.from_square = from_square
+        self.to_square = to_square
+        self.is_king = is_king
+        self.captured_men = captured_men
+        self.captured_kings = captured_kings
+        self.promotion = promotion
+        self.path = path if path is not None else (from_square, to_square)
+
+        # Bits to flip in the mover's own masks. A king that jumps around in a
+        # circle can end on its starting square, in which case nothing moves.
+        from_bit = 1 << from_square
+        to_bit = 1 << to_square
+        if is_king:
+            self.men_toggle = 0
+            self.kings_toggle = from_bit ^ to_bit
+        elif promotion:
+            self.men_toggle = from_bit
+            self.kings_toggle = to_bit
+        else:
+            self.men_toggle = from_bit ^ to_bit
+            self.kings_toggle = 0
+
+        # Change of the board's Zobrist hash, and a compact key identifying the move
+        # among its siblings (two jump sequences with the same start, end and
+        # captures lead to the same position).
+        own_kind = red_men_kind if red_turn else black_men_kind
+        opponent_kind = black_men_kind if red_turn else red_men_kind
+        self.hash_delta = zobrist_hash(self.men_toggle, own_kind) ^ zobrist_hash(self.kings_toggle, own_kind + 1) \
+            ^ zobrist_hash(captured_men, opponent_kind) ^ zobrist_hash(captured_kings, opponent_kind + 1)
+        self.key = from_square | to_square << 5 | (captured_men | captured_kings) << 10
+        self.captures = bin(captured_men | captured_kings).count('1')
+        # Captures and moves of basic pieces can never be undone, so no position
+        # before one of them can occur again.
+        self.irreversible = bool(self.men_toggle or captured_men or captured_kings)
+
+        # Change of the board's running evaluation.
+        self.score_delta = self.score_change()
+
+    def score_change(self):
+        """
+        :return: The change the move makes to the running evaluation of a board,
+            from the current piece-square scores.
+        :rtype: int
+        """
+        own_kind = red_men_kind if self.red_turn else black_men_kind
+        opponent_kind = black_men_kind if self.red_turn else red_men_kind
+        own_scores = piece_square_scores[own_kind + 1 if self.is_king or self.promotion else own_kind]
+        return own_scores[self.to_square] - piece_square_scores[own_kind + 1 if self.is_king else own_kind][self.from_square] \
+            - mask_score(self.captured_men, opponent_kind) - mask_score(self.captured_kings, opponent_kind + 1)
+
+    def captured_squares(self):
+        """
+        :return: The squares of every piece captured by the move.
+        :rtype: List[int]
+        """
+        return list(bit_squares(self.captured_men | self.captured_kings))
+
+    def __repr__(self):
+        return '{} {} {} {} {}'.format(self.red_turn, \
+            [square_coords[square] for square in self.path], self.captured_squares(), self.promotion, self.is_king)
+
+#====================================================================================
+# Move tables, built once at import time. For each piece kind and each dark square they
+# list the simple moves and the jumps the piece could make on an empty board, so move
+# generation only has to test occupancy bits. Directions are (x change, y change):
+# up right, up left, down right, down left. Up is forward for red and down for black.
+diagonal_directions = [(1, -1), (-1, -1), (1, 1), (-1, 1)]
+piece_directions = [(0, 1), (0, 1, 2, 3), (2, 3), (2, 3, 0, 1)] # Indexed by piece kind
+promotion_squares = [0xF, 0, 0xF << 28, 0] # Squares where a basic piece of each kind is crowned
+
+step_table = [] # step_table[kind][square]: tuple of (destination bit, Move) per simple move
+jump_table = [] # jump_table[kind][square]: tuple of (jumped bit, landing bit, landing square) per jump
+for kind in range(4):
+    kind_steps = []
+    kind_jumps = []
+    for square in range(num_squares):
+        (x_coord, y_coord) = square_coords[square]
+        square_steps = []
+        square_jumps = []
+        for direction in piece_directions[kind]:
+            (x_change, y_change) = diagonal_directions[direction]
+            if (x_coord + x_change) in valid_positions and (y_coord + y_change) in valid_positions:
+                to_square = square_index(x_coord + x_change, y_coord + y_change)
+                promotion = bool(promotion_squares[kind] & (1 << to_square))
+                square_steps.append((1 << to_square, Move(kind < black_men_kind, square, to_square,
+                                                          kind in king_kinds, promotion=promotion)))
+            if (x_coord + 2 * x_change) in valid_positions and (y_coord + 2 * y_change) in valid_positions:
+                over_square = square_index(x_coord + x_change, y_coord + y_change)
+                land_square = square_index(x_coord + 2 * x_change, y_coord + 2 * y_change)
+                square_jumps.append((1 << over_square, 1 << land_square, land_square))
+        kind_steps.append(tuple(square_steps))
+        kind_jumps.append(tuple(square_jumps))
+    step_table.append(kind_steps)
+    jump_table.append(kind_jumps)
+
+
+evaluation_weights = ('piece', 'king', 'advancement', 'centre', 'edge', 'home')
+
+
+def get_weights():
+    """
+    :return: The evaluation weights in points, by name (see evaluation_weights).
+    :rtype: Dict[str, float]
+    """
+    return {'piece': piece_score / score_scale, 'king': king_score / score_scale,
+            'advancement': advancement_score / score_scale, 'centre': centre_score / score_scale,
+            'edge': edge_score / score_scale, 'home': home_score / score_scale}
+
+
+default_weights = get_weights()
+
+
+def set_weights(weights):
+    """
+    Changes evaluation weights and rebuilds everything derived from them: the
+    piece-square scores, the batch evaluation tables and the score change of the
+    precomputed simple moves. Weights are rounded to whole score_scale units.
+    Existing boards keep their running evaluation until Board.rescore is called,
+    and the transposition table and evaluation cache should be cleared of values
+    found with other weights.
+
+    :param weights: New weights in points, by name; the others keep their value.
+    :type weights: Dict[str, float]
+    """
+    global piece_score, king_score, advancement_score, centre_score, edge_score, home_score
+    global byte_scores, square_weights
+    for name in weights:
+        if name not in evaluation_weights:
+            raise ValueError('Unknown evaluation weight {!r}'.format(name))
+    values = get_weights()
+    values.update(weights)
+    piece_score = int(round(values['piece'] * score_scale))
+    king_score = int(round(values['king'] * score_scale))
+    advancement_score = int(round(values['advancement'] * score_scale))
+    centre_score = int(round(values['centre'] * score_scale))
+    edge_score = int(round(values['edge'] * score_scale))
+    home_score = int(round(values['home'] * score_scale))
+    for kind in range(4):
+        for square in range(num_squares):
+            piece_square_scores[kind][square] = piece_square_score(kind, square)
+    byte_scores = build_byte_scores()
+    if numpy is not None:
+        square_weights = numpy.array(piece_square_scores, dtype=numpy.int64)
+    for kind_steps in step_table:
+        for square_steps in kind_steps:
+            for (to_bit, move) in square_steps:
+                move.score_delta = move.score_change()
+
+
 class Board:
     """
     Board class for setting up the playing board.
+
+    The position is stored as four 32-bit masks over the dark squares (red men,
+    red kings, black men and black kings), so moving a piece only flips bits.
     """
 
-    def __init__(self, pieces):
+    __slots__ = ('red_men', 'red_kings', 'black_men', 'black_kings', 'hash', 'score')
+    width = 8
+    height = 8
+
+    def __init__(self, pieces=(), red_men=0, red_kings=0, black_men=0, black_kings=0):
         """
-        :param pieces: The list of Pieces
+        :param pieces: Optional list of Pieces to place on the board.
         :type pieces: List[Piece]
+        :param red_men: Bitboard of the red basic pieces.
+        :type red_men: int
+        :param red_kings: Bitboard of the red kings.
+        :type red_kings: int
+        :param black_men: Bitboard of the black basic pieces.
+        :type black_men: int
+        :param black_kings: Bitboard of the black kings.
+        :type black_kings: int
         """
 
-        self.width = 8
-        self.height = 8
+        self.red_men = red_men
+        self.red_kings = red_kings
+        self.black_men = black_men
+        self.black_kings = black_kings
+        self.hash = zobrist_hash(red_men, red_men_kind) ^ zobrist_hash(red_kings, red_kings_kind) \
+            ^ zobrist_hash(black_men, black_men_kind) ^ zobrist_hash(black_kings, black_kings_kind)
+        self.rescore()
 
-        self.pieces = pieces
+        for piece in pieces:
+            self.add_piece(piece.is_red, piece.is_king, piece.coord_x, piece.coord_y)
 
-        # self.grid is a 2-d (size * size) array automatically generated
-        # using the information on the pieces when a board is being created.
-        # A grid contains the symbol for representing the pieces on the board.
-        self.grid = []
-        self.__construct_grid()
+    def rescore(self):
+        """
+        Recomputes the running evaluation of the board in score_scale units (see
+        evaluation_fcn) from its pieces and the current weights.
+        """
+        self.score = mask_score(self.red_men, red_men_kind) + mask_score(self.red_kings, red_kings_kind) \
+            + mask_score(self.black_men, black_men_kind) + mask_score(self.black_kings, black_kings_kind)
 
+    def add_piece(self, is_red, is_king, x_coord, y_coord):
+        """
+        Places a piece on a dark square of the board.
+
+        :param is_red: True if the piece is red.
+        :type is_red: bool
+        :param is_king: True if the piece is a king.
+        :type is_king: bool
+        :param x_coord: The column of the square.
+        :type x_coord: int
+        :param y_coord: The row of the square.
+        :type y_coord: int
+        """
+        if (x_coord + y_coord) % 2 == 0:
+            raise ValueError('Piece at ({}, {}) is not on a dark square'.format(x_coord, y_coord))
+        square = square_index(x_coord, y_coord)
+        bit = 1 << square
+        if is_red and is_king:
+            self.red_kings |= bit
+            kind = red_kings_kind
+        elif is_red:
+            self.red_men |= bit
+            kind = red_men_kind
+        elif is_king:
+            self.black_kings |= bit
+            kind = black_kings_kind
+        else:
+            self.black_men |= bit
+            kind = black_men_kind
+        self.hash ^= zobrist_keys[kind][square]
+        self.score += piece_square_scores[kind][square]
 
-    def __construct_grid(self):
+    def position_key(self, red_turn):
         """
-        Called in __init__ to set up a 2-d grid based on the piece location information.
+        Returns the Zobrist hash of the board combined with the side to move.
 
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :rtype: int
         """
-        self.grid = []
-        for i in range(self.height):
-            line = []
-            for j in range(self.width):
-                line.append('.')
-            self.grid.append(line)
+        if red_turn:
+            return self.hash ^ zobrist_red_turn
+        return self.hash
 
-        for piece in self.pieces:
-            if piece.is_red: ## Piece is red
-              if piece.is_king:
-                self.grid[piece.coord_y][piece.coord_x] = char_red_king
-              else:
-                self.grid[piece.coord_y][piece.coord_x] = char_red_basic
-            else:
-              if piece.is_king:
-                self.grid[piece.coord_y][piece.coord_x] = char_black_king
-              else:
-                self.grid[piece.coord_y][piece.coord_x] = char_black_basic
-                
+    def copy(self):
+        """
+        Returns an independent copy of the board. Only four integers are copied.
+
+        :rtype: Board
+        """
+        return Board((), self.red_men, self.red_kings, self.black_men, self.black_kings)
+
+    def red_pieces(self):
+        return self.red_men | self.red_kings
+
+    def black_pieces(self):
+        return self.black_men | self.black_kings
+
+    def occupied(self):
+        return self.red_men | self.red_kings | self.black_men | self.black_kings
+
+    def piece_at(self, x_coord, y_coord):
+        """
+        Returns the character of the piece on a square (empty_slot if there is none).
+
+        :rtype: str
+        """
+        if (x_coord + y_coord) % 2 == 0:
+            return empty_slot
+        bit = 1 << square_index(x_coord, y_coord)
+        if self.red_men & bit:
+            return char_red_basic
+        if self.red_kings & bit:
+            return char_red_king
+        if self.black_men & bit:
+            return char_black_basic
+        if self.black_kings & bit:
+            return char_black_king
+        return empty_slot
+
+    @property
+    def grid(self):
+        """
+        The 8x8 grid of piece characters, built from the bitboards on demand.
+        """
+        grid = [[empty_slot] * self.width for i in range(self.height)]
+        for mask, char in ((self.red_men, char_red_basic), (self.red_kings, char_red_king),
+                           (self.black_men, char_black_basic), (self.black_kings, char_black_king)):
+            for square in bit_squares(mask):
+                (x_coord, y_coord) = square_coords[square]
+                grid[y_coord][x_coord] = char
+        return grid
+
+    @property
+    def pieces(self):
+        """
+        The list of Pieces on the board, built from the bitboards on demand.
+        """
+        pieces = []
+        for mask, is_red, is_king in ((self.red_men, True, False), (self.red_kings, True, True),
+                                      (self.black_men, False, False), (self.black_kings, False, True)):
+            for square in bit_squares(mask):
+                (x_coord, y_coord) = square_coords[square]
+                pieces.append(Piece(is_red, is_king, x_coord, y_coord))
+        return pieces
 
     def display(self):
         """
@@ -108,28 +649,22 @@ class Board:
 
     def red_piece_finder(self):
         coord = [[],[]] ## First list is for king locations, second is for basic pieces
-        for piece in self.pieces:
-            if piece.is_red and piece.is_king:
-                coord[0].append((piece.coord_x, piece.coord_y))
-            elif piece.is_red and not piece.is_king:
-                coord[1].append((piece.coord_x, piece.coord_y))
+        coord[0] = [square_coords[square] for square in bit_squares(self.red_kings)]
+        coord[1] = [square_coords[square] for square in bit_squares(self.red_men)]
         return coord
     
     def black_piece_finder(self):
         coord = [[],[]] ## First list is for king locations, second is for basic pieces
-        for piece in self.pieces:
-            if not piece.is_red and piece.is_king:
-                coord[0].append((piece.coord_x, piece.coord_y))
-            elif not piece.is_red and not piece.is_king:
-                coord[1].append((piece.coord_x, piece.coord_y))
+        coord[0] = [square_coords[square] for square in bit_squares(self.black_kings)]
+        coord[1] = [square_coords[square] for square in bit_squares(self.black_men)]
         return coord
     
-    def pieces_on_board(self, colour): ##Change to function that finds all pieces of that colour
+    def pieces_on_board(self, colour):
         """
-        Finds all empty spaces in the board. Returns list of tuples in form of [(x1,y1), (x2,y2)]
+        Finds the coordinates of all pieces of one colour.
 
-        :return: List of tuples containing coordinates of empty piecies
-        :rtype: List[Tuples]
+        :return: Two lists of (x, y) tuples, the first for kings and the second for basic pieces
+        :rtype: List[List[Tuples]]
         :colour : True if red turn
         """ 
         if colour == True:
@@ -138,166 +673,174 @@ class Board:
             coordinates_of_pieces = self.black_piece_finder()
         return coordinates_of_pieces
 
-    def general_move_check(self, red_turn, x_c, y_c, jumps, regular, x_d, y_d, is_King):
-        if len(jumps) == 0 or jumps == None:
-            #Check regular moves too
-            if ((x_c + x_d) in valid_positions) and ((y_c + y_d) in valid_positions):
-                if self.grid[y_c + y_d][x_c + x_d] == empty_slot:
-                    new_board = deepcopy(self)
-                    new_board.move(x_c, y_c, x_d, y_d, jumps, red_turn, is_King)
-                    regular.append(new_board)
-        if ((x_c + 2 * x_d) in valid_positions) and ((y_c + 2 * y_d) in valid_positions):
-            if red_turn:
-                if self.grid[y_c + y_d][x_c + x_d] in valid_black and self.grid[y_c + 2 * y_d][x_c + 2 * x_d] == empty_slot:
-                    jumps = self.jump_finder(red_turn, x_c, y_c, x_d, y_d, jumps, is_King)
-            else:
-                if self.grid[y_c + y_d][x_c + x_d] in valid_red and self.grid[y_c + 2 * y_d][x_c + 2 * x_d] == empty_slot:
-                    jumps = self.jump_finder(red_turn, x_c, y_c, x_d, y_d, jumps, is_King)
-        return (jumps, regular)
-    
-    def up_right_move_check(self, red_turn, x_coord, y_coord, jumps, regular, is_King):
-        (jumps, regular) = self.general_move_check(red_turn, x_coord, y_coord, jumps, regular, 1, -1, is_King)
-        return (jumps, regular)
-
-    def up_left_move_check(self, red_turn, x_coord, y_coord, jumps, regular, is_King):
-        (jumps, regular) = self.general_move_check(red_turn, x_coord, y_coord, jumps, regular, -1, -1, is_King)
-        return (jumps, regular)
-    
-    def down_right_move_check(self, red_turn, x_coord, y_coord, jumps, regular, is_King):
-        (jumps, regular) = self.general_move_check(red_turn, x_coord, y_coord, jumps, regular, 1, 1, is_King)
-        return (jumps, regular)
-    
-    def down_left_move_check(self, red_turn, x_coord, y_coord, jumps, regular, is_King):
-        (jumps, regular) = self.general_move_check(red_turn, x_coord, y_coord, jumps, regular, -1, 1, is_King)
-        return (jumps, regular)
-
-    def jump_finder(self, red_turn, x_coord, y_coord, x_change, y_change, jumps, is_King): ##recursive function to find all jumps
+    def generate_moves(self, red_turn, moves=None):
+        """
+        Finds every legal move of one player from the move tables. Kings are
+        considered before basic pieces. Jumping is mandatory, so simple moves are
+        only returned when no jump exists.
+
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :param moves: A list to reuse for the moves, emptied first, or None for a new list.
+        :type moves: Optional[List[Move]]
+        :return: The list of Moves, and True if they are jumps
+        :rtype: Tuple[List[Move], bool]
+        """
+        if red_turn:
+            pieces = ((self.red_kings, red_kings_kind), (self.red_men, red_men_kind))
+            opponent = self.black_men | self.black_kings
+        else:
+            pieces = ((self.black_kings, black_kings_kind), (self.black_men, black_men_kind))
+            opponent = self.red_men | self.red_kings
+        empty = ~self.occupied()
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        jumping = False
+        for (mask, kind) in pieces:
+            for square in bit_squares(mask):
+                for (over_bit, land_bit, land_square) in jump_table[kind][square]:
+                    if opponent & over_bit and empty & land_bit:
+                        if not jumping:
+                            # The simple moves found so far are not legal after all.
+                            moves.clear()
+                            jumping = True
+                        self.jump_finder(red_turn, kind, land_square, over_bit, (square,), 0, 0, moves)
+                if not jumping:
+                    for (to_bit, move) in step_table[kind][square]:
+                        if empty & to_bit:
+                            moves.append(move)
+        return (moves, jumping)
+
+    def has_jump(self, red_turn):
+        """
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :return: True if the player has a jump, so that every legal move is a jump.
+        :rtype: bool
+        """
+        if red_turn:
+            pieces = ((self.red_kings, red_kings_kind), (self.red_men, red_men_kind))
+            opponent = self.black_men | self.black_kings
+        else:
+            pieces = ((self.black_kings, black_kings_kind), (self.black_men, black_men_kind))
+            opponent = self.red_men | self.red_kings
+        empty = ~self.occupied()
+        for (mask, kind) in pieces:
+            for square in bit_squares(mask):
+                for (over_bit, land_bit, land_square) in jump_table[kind][square]:
+                    if opponent & over_bit and empty & land_bit:
+                        return True
+        return False
+
+    def has_step(self, red_turn):
+        """
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :return: True if the player has a simple move, ignoring whether a jump must be made instead.
+        :rtype: bool
+        """
+        if red_turn:
+            pieces = ((self.red_kings, red_kings_kind), (self.red_men, red_men_kind))
+        else:
+            pieces = ((self.black_kings, black_kings_kind), (self.black_men, black_men_kind))
+        empty = ~self.occupied()
+        for (mask, kind) in pieces:
+            for square in bit_squares(mask):
+                for (to_bit, move) in step_table[kind][square]:
+                    if empty & to_bit:
+                        return True
+        return False
+
+    def jump_finder(self, red_turn, kind, square, over_bit, path, captured_men, captured_kings, jumps): ##recursive function to find all jumps
         '''
-        Keep appending new states to a list which keep going recursively
-        0. We know jump is possible so make copy of board and make the move 
+        Keep appending finished jump sequences to a list, recursing once per hop.
+        The board itself is never modified: the pieces captured so far are carried
+        along as masks and the squares visited as the path.
+        0. We know the hop over over_bit to square is possible so record the capture
         1. Base Case: if end of turn
             a) no more jumps possible
             b) becomes a King
-        2. Check if two directions work for normal and if so make copy of board and make the move 
-        3. If King check all the directions
+        2. Otherwise keep jumping in every direction the jump table allows for this kind of piece
         '''
-        new_board = deepcopy(self)
-        (new_board, new_King) = new_board.move(x_coord, y_coord, x_change, y_change, True, red_turn, is_King)
-        count = 0
-        x_c = x_coord + 2 * x_change
-        y_c = y_coord + 2 * y_change
-        
-        if new_King:
-           jumps.append(new_board) 
-           return jumps
-
-        if not red_turn:
-            if (x_c + 2) in valid_positions and (y_c + 2) in valid_positions:
-                if new_board.grid[y_c + 1][x_c + 1] in valid_red and new_board.grid[y_c + 2][x_c + 2] == empty_slot:
-                    jumps = new_board.jump_finder(red_turn, x_c, y_c, 1, 1, jumps, is_King)
-                    count += 1
-            if (x_c - 2) in valid_positions and (y_c + 2) in valid_positions:
-                if new_board.grid[y_c + 1][x_c - 1] in valid_red and new_board.grid[y_c + 2][x_c - 2] == empty_slot:
-                    jumps = new_board.jump_finder(red_turn, x_c, y_c, -1, 1, jumps, is_King)
-                    count += 1
-            if is_King:
-                if (x_c + 2) in valid_positions and (y_c - 2) in valid_positions:
-                    if new_board.grid[y_c - 1][x_c + 1] in valid_red and new_board.grid[y_c - 2][x_c + 2] == empty_slot:
-                        jumps = new_board.jump_finder(red_turn, x_c, y_c, 1, -1, jumps, is_King)
-                        count += 1
-                
-                if (x_c - 2) in valid_positions and (y_c - 2) in valid_positions:
-                    if new_board.grid[y_c - 1][x_c - 1] in valid_red and new_board.grid[y_c - 2][x_c - 2] == empty_slot:
-                        jumps = new_board.jump_finder(red_turn, x_c, y_c, -1, -1, jumps, is_King)
-                        count += 1
-            if count == 0:
-                jumps.append(new_board)
-                return jumps
+        if (self.black_kings if red_turn else self.red_kings) & over_bit:
+            captured_kings |= over_bit
         else:
-            if (x_c + 2) in valid_positions and (y_c - 2) in valid_positions:
-                if new_board.grid[y_c - 1][x_c + 1] in valid_black and new_board.grid[y_c - 2][x_c + 2] == empty_slot:
-                    jumps = new_board.jump_finder(red_turn, x_c, y_c, 1, -1, jumps, is_King)
-                    count += 1
-            if (x_c - 2) in valid_positions and (y_c - 2) in valid_positions:
-                if new_board.grid[y_c - 1][x_c - 1] in valid_black and new_board.grid[y_c - 2][x_c - 2] == empty_slot:
-                    jumps = new_board.jump_finder(red_turn, x_c, y_c, -1, -1, jumps, is_King)
-                    count += 1
-            if is_King:
-                if (x_c + 2) in valid_positions and (y_c + 2) in valid_positions:
-                    if self.grid[y_c + 1][x_c + 1] in valid_black and self.grid[y_c + 2][x_c + 2] == empty_slot:
-                        jumps = new_board.jump_finder(red_turn, x_c, y_c, 1, 1, jumps, is_King)
-                        count += 1   
-                if (x_c - 2) in valid_positions and (y_c + 2) in valid_positions:
-                    if new_board.grid[y_c + 1][x_c - 1] in valid_black and new_board.grid[y_c + 2][x_c - 2] == empty_slot:
-                        jumps = new_board.jump_finder(red_turn, x_c, y_c, -1, 1, jumps, is_King)
-                        count += 1
-            if count == 0:
-                jumps.append(new_board) 
-                return jumps 
+            captured_men |= over_bit
+        path = path + (square,)
+        is_King = kind in king_kinds
+        
+        if promotion_squares[kind] & (1 << square):
+            jumps.append(Move(red_turn, path[0], square, is_King, captured_men, captured_kings, True, path))
+            return jumps
 
+        # The jumping piece has left its starting square and the captured pieces are gone.
+        captured = captured_men | captured_kings
+        opponent = (self.black_pieces() if red_turn else self.red_pieces()) & ~captured
+        empty = ~(self.occupied() & ~captured) | (1 << path[0])
+
+        count = 0
+        for (next_over_bit, land_bit, land_square) in jump_table[kind][square]:
+            if opponent & next_over_bit and empty & land_bit:
+                self.jump_finder(red_turn, kind, land_square, next_over_bit, path, captured_men, captured_kings, jumps)
+                count += 1
+        if count == 0:
+            jumps.append(Move(red_turn, path[0], square, is_King, captured_men, captured_kings, False, path))
         return jumps
-    
-    def delete(self, x_coord, y_coord, x_change, y_change):
-        del_x = x_coord + x_change
-        del_y = y_coord + y_change
-        
-        for piece in self.pieces:
-            if piece.coord_x == del_x and piece.coord_y == del_y:
-                self.pieces.remove(piece)
-                break
-        self.__construct_grid()
-
-    def move(self, x_coord, y_coord, x_change, y_change, jump, red_turn, is_King):
-        """
-        - Need to delete captured pieces from self.pieces
-        - Need to move piece to final location
-        - Need to update it to King if necessary
-        """
-        #Find the piece that you want to move based on the x and y coordinate 
-        multiplier = 1
-        if jump:
-            multiplier = 2
-            self.delete(x_coord, y_coord, x_change, y_change)
-        for piece in self.pieces:
-            if piece.coord_x == x_coord and piece.coord_y == y_coord:
-                piece.coord_y += multiplier * y_change
-                new_height = piece.coord_y
-                piece.coord_x += multiplier * x_change
-                break
-        if red_turn and not is_King and new_height == 0:
-            piece.is_king = True
-            self.__construct_grid()
-            return (self, True)
-        if not red_turn and not is_King and new_height == 7:
-            piece.is_king = True
-            self.__construct_grid()
-            return (self, True)
-        self.__construct_grid()
-        return (self, False)
+
+    def make(self, move):
+        """
+        Applies a move to the board in place.
+
+        :param move: The move to carry out.
+        :type move: Move
+        """
+        if move.red_turn:
+            self.red_men ^= move.men_toggle
+            self.red_kings ^= move.kings_toggle
+            self.black_men ^= move.captured_men
+            self.black_kings ^= move.captured_kings
+        else:
+            self.black_men ^= move.men_toggle
+            self.black_kings ^= move.kings_toggle
+            self.red_men ^= move.captured_men
+            self.red_kings ^= move.captured_kings
+        self.hash ^= move.hash_delta
+        self.score += move.score_delta
+
+    def unmake(self, move):
+        """
+        Takes back a move previously applied with make. Every change to the masks
+        and the hash is a bit flip, so undoing it flips the same bits again.
+
+        :param move: The move to take back.
+        :type move: Move
+        """
+        if move.red_turn:
+            self.red_men ^= move.men_toggle
+            self.red_kings ^= move.kings_toggle
+            self.black_men ^= move.captured_men
+            self.black_kings ^= move.captured_kings
+        else:
+            self.black_men ^= move.men_toggle
+            self.black_kings ^= move.kings_toggle
+            self.red_men ^= move.captured_men
+            self.red_kings ^= move.captured_kings
+        self.hash ^= move.hash_delta
+        self.score -= move.score_delta
+
+    def piece_count(self):
+        return bin(self.occupied()).count('1')
 
     def pieces_check_end_game(self):
-        black_piece_on_board = False
-        red_piece_on_board = False
-        for piece in self.pieces:
-            if piece.is_red:
-                red_piece_on_board = True
-            else:
-                black_piece_on_board = True
-        return not (red_piece_on_board and black_piece_on_board)
+        return not (self.red_pieces() and self.black_pieces())
     
     def red_pieces_on_board(self):
-        red_piece_on_board = False
-        for piece in self.pieces:
-            if piece.is_red:
-                red_piece_on_board = True
-        return red_piece_on_board
+        return self.red_pieces() != 0
     
     def black_pieces_on_board(self):
-        black_piece_on_board = False
-        for piece in self.pieces:
-            if not piece.is_red:
-                black_piece_on_board = True
-        return black_piece_on_board
+        return self.black_pieces() != 0
     
     def opponent_distance(self, x_c, y_c, red):
         if red:
@@ -305,41 +848,37 @@ class Board:
         else:
             return self.closest_red(x_c, y_c)
 
-    def closest_black(self, x_c, y_c):
+    def closest_piece(self, x_c, y_c, mask):
         minimum = utility
-        for piece in self.pieces:
-            if not piece.is_red:
-                distance = abs(x_c - piece.coord_x) + abs(y_c - piece.coord_y)
-                if distance < minimum:
-                    minimum = distance
+        for square in bit_squares(mask):
+            (x_p, y_p) = square_coords[square]
+            distance = abs(x_c - x_p) + abs(y_c - y_p)
+            if distance < minimum:
+                minimum = distance
         return minimum
 
-    def closest_red(self, x_c, y_c):
-        minimum = utility
-        for piece in self.pieces:
-            if piece.is_red:
-                distance = abs(x_c - piece.coord_x) + abs(y_c - piece.coord_y)
-                if distance < minimum:
-                    minimum = distance
-        return minimum
+    def closest_black(self, x_c, y_c):
+        return self.closest_piece(x_c, y_c, self.black_pieces())
 
+    def closest_red(self, x_c, y_c):
+        return self.closest_piece(x_c, y_c, self.red_pieces())
 
     def find_avg_distance_red(self):
         distance_sum = 0
         piece_count = 0
-        for piece in self.pieces:
-            if piece.is_red:
-                distance_sum += self.opponent_distance(piece.coord_x, piece.coord_y, True)
-                piece_count += 1
+        for square in bit_squares(self.red_pieces()):
+            (x_c, y_c) = square_coords[square]
+            distance_sum += self.opponent_distance(x_c, y_c, True)
+            piece_count += 1
         return distance_sum/piece_count
     
     def find_avg_distance_black(self):
         distance_sum = 0
         piece_count = 0
-        for piece in self.pieces:
-            if not piece.is_red:
-                distance_sum += self.opponent_distance(piece.coord_x, piece.coord_y, False)
-                piece_count += 1
+        for square in bit_squares(self.black_pieces()):
+            (x_c, y_c) = square_coords[square]
+            distance_sum += self.opponent_distance(x_c, y_c, False)
+            piece_count += 1
         return distance_sum/piece_count
     
     def evaluation_fcn(self):
@@ -352,317 +891,2561 @@ class Board:
         6. Attack on double corner side
         7. Better if you have more moves available then opponent
 
+        Every term depends on a single piece and its square (see piece_square_score),
+        so the board keeps the total up to date in make and unmake and no pieces
+        need to be scanned here.
         '''
 
-        eval = 0
-        if not self.red_pieces_on_board:
+        if not self.red_pieces_on_board():
             return neg_utility
-        if not self.black_pieces_on_board:
+        if not self.black_pieces_on_board():
             return utility
-        red = 0
-        black = 0
-        for piece in self.pieces:
-            if piece.is_red:
-                red += 1
-                if (piece.coord_x, piece.coord_y) in centre_slots:
-                    eval += 0.25
-                if piece.is_king:
-                    eval += 1.5
-                else:
-                    advancement = (7 - piece.coord_y)/14
-                    eval += 1 + advancement
-                if piece.coord_x == 0 or piece.coord_y == 0 or piece.coord_x == 7:
-                    eval += 0.01
-                if piece.coord_x == 7:
-                    eval += 0.25
-            else:
-                black += 1
-                if (piece.coord_x, piece.coord_y) in centre_slots:
-                    eval -= 0.25
-                if piece.is_king:
-                    eval -= 1.5
-                else:
-                    advancement = piece.coord_y/14
-                    eval -= (1 + advancement)
-                if piece.coord_x == 7 or piece.coord_y == 0 or piece.coord_x == 7:
-                    eval -= 0.01
-                if piece.coord_x == 0:
-                    eval -= 0.25
-        if red>black:
-            #Want to move closer to opponent
-            self.find_avg_distance_red()
-        elif black>red:
-            self.find_avg_distance_black()
-            eval += 0
-        else:
-            pass
-
-        return eval
+        return self.score / score_scale
 
         
 
-class State:
+class TranspositionTable:
     """
-    State class wrapping a Board with some extra current state information.
-    Note that State and Board are different. Board has the locations of the pieces. 
-    State has a Board and some extra information that is relevant to the search: 
-    heuristic function, f value, current depth and parent.
+    Zobrist-keyed cache of search results shared by every node of a search and
+    kept between the moves of one game.
+
+    Each bucket holds two entries: a depth-preferred slot that keeps the result of
+    the deepest search of a position, and an always-replace slot that keeps the
+    most recent one. An entry is a tuple (key, draft, value, bound, move key) where
+    draft is the number of plies that were left to search below the position.
     """
 
-    def __init__(self, board, parent=None, red_turn = True):
+    entry_bytes = 160 # Approximate size of one entry including its tuple and numbers
+
+    def __init__(self, size_mb=tt_size_mb):
         """
-        :param board: The board of the state.
-        :type board: Board
-        :param parent: The parent of current state.
-        :type parent: Optional[State]
+        :param size_mb: The memory cap of the table in megabytes (0 disables the table).
+        :type size_mb: float
         """
-        self.board = board
-        self.parent = parent
-        self.red_turn = red_turn
-    
-    def move_finder(self):
-        #Steps
-        '''
-        1. Find all piece coordinates
-        2. For all kings (first list) find all possible moves
-                a)Check up right move with function if in bounds
-                b)Check up left move with function if in bounds
-                c)Check down right move if in bounds with a function
-                d)Check down left move if in bounds with a function
-        3. For all basic pieces (second list) find all possible moves
-                if red:
-                    a) Check up (forward) right move
-                    b) Check up (forward) left move
-                if black:
-                    a) Check down (forward) right move
-                    b) Check down (forward) left move
-        4. With all moves, create the tree by calling alpha-beta pruning decisons with jump moves if it is available or regular moves if no jump moves
-            a) This tree should find the path to take or at least move to make
-            b) OPTIONAL: Implement node ordering/state caching at end if you have time
-        5. With this move, call the move function in board to update the board
-        6. Switch turns by setting red_turn to not red_turn
+        self.size_mb = size_mb
+        self.size = int(size_mb * 1024 * 1024) // (2 * self.entry_bytes)
+        self.clear()
 
-        returns:
-        Jump moves with True if there are possible jump moves
-        Regular moves with False if there are no jump moves 
-                
-        '''
-        piece_coord = []
-        piece_coord = self.board.pieces_on_board(self.red_turn)
-        jump_moves = [] #list of new states
-        regular_moves = [] #List of new states 
-        for piece_loc in piece_coord[0]: ##Locations of the Kings
-            (x_coord, y_coord) = piece_loc
-            (jump_moves, regular_moves) = self.board.up_right_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, True)
-            (jump_moves, regular_moves) = self.board.up_left_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, True)
-            (jump_moves, regular_moves) = self.board.down_right_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, True)
-            (jump_moves, regular_moves) = self.board.down_left_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, True)
-        for piece_loc in piece_coord[1]:
-            (x_coord, y_coord) = piece_loc
-            if self.red_turn:
-                (jump_moves, regular_moves) = self.board.up_right_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, False)
-                (jump_moves, regular_moves) = self.board.up_left_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, False)
-            else:
-                (jump_moves, regular_moves) = self.board.down_right_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, False)
-                (jump_moves, regular_moves) = self.board.down_left_move_check(self.red_turn, x_coord, y_coord,jump_moves,regular_moves, False)
- 
-        if len(jump_moves) == 0:
-            return (regular_moves, False)  
-        else:
-            return (jump_moves, True)
+    def clear(self):
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
 
-    def alpha_beta_prune(self):
-        (moves, jumping) = self.move_finder()
-        if len(moves) == 0:
-            stalemate = True
-            return self
-        if self.red_turn:
-            optimal_state = self.MAX_VALUE(float('-inf'), float('inf'), 1)[0]
-        else:
-            optimal_state = self.MIN_VALUE(float('-inf'), float('inf'), 1)[0]
-        next_state = State(optimal_state.board, self, not self.red_turn)
-        return next_state
-    
-    def MAX_VALUE(self, alpha, beta, depth):
-        if depth == depth_limit or self.board.pieces_check_end_game():
-            return (None, self.board.evaluation_fcn())
-        v = float('-inf')
-        moves = self.move_finder()[0]
-        pq = []
-        heapq.heapify(pq)
-        for move in moves:
-            heappush(pq, (move.evaluation_fcn() * -1, hash(move), move))
-        #sort moves based on evals from max to min
-        while len(pq) > 0:
-            action = heapq.heappop(pq)[2]
-        # for action in moves:
-            new_state = State(action, None, not self.red_turn)
-            min_val = new_state.MIN_VALUE(alpha, beta, depth + 1)[1]
-            if v < min_val:
-                v = min_val
-                best_state = new_state
-            if v >= beta:
-                return (None, v)
-            alpha = max(alpha, v)
-        if depth == 1:
-            return (best_state, v)
-        return (None, v)
-    
-    def MIN_VALUE(self, alpha, beta, depth):
-        if depth == depth_limit or self.board.pieces_check_end_game():
-            return (None, self.board.evaluation_fcn())
-        v = float('inf')
-        moves = self.move_finder()[0]
-        #sort moves based on evals
-        pq = []
-        heapq.heapify(pq)
-        for move in moves:
-            heappush(pq, (move.evaluation_fcn(), hash(move), move))
-        #sort moves based on evals from max to min
-        while len(pq) > 0:
-            action = heapq.heappop(pq)[2]
-        # for action in moves:
-            new_state = State(action, None, not self.red_turn)
-            max_val = new_state.MAX_VALUE(alpha, beta, depth + 1)[1]
-            if v > max_val:
-                v = max_val
-                best_state = new_state
-            if v <= alpha:
-                return (None, v)
-            beta = min(beta, v)
-        if depth == 1:
-            return (best_state, v)
-        return (None, v)
+    def probe(self, key):
+        """
+        Returns the entry stored for a position key, or None if there is none.
 
-    def output(self, state, file):
+        :param key: The position key from Board.position_key.
+        :type key: int
+        :rtype: Optional[Tuple]
         """
-        Prints all parents of a current state to a file.
+        if self.size == 0:
+            return None
+        index = key % self.size
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recent[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, draft, value, bound, move_key):
+        """
+        Records the result of searching a position.
+
+        :param key: The position key from Board.position_key.
+        :type key: int
+        :param draft: The number of plies searched below the position.
+        :type draft: int
+        :param value: The value found by the search.
+        :type value: float
+        :param bound: exact_bound, lower_bound or upper_bound.
+        :type bound: int
+        :param move_key: The key of the best move, or None.
+        :type move_key: Optional[int]
+        """
+        if self.size == 0:
+            return
+        index = key % self.size
+        entry = (key, draft, value, bound, move_key)
+        deep = self.deep[index]
+        if deep is None or deep[0] == key or draft >= deep[1]:
+            self.deep[index] = entry
+            if deep is not None and deep[0] != key:
+                self.recent[index] = deep
+        else:
+            self.recent[index] = entry
 
-        :param state: The current state of which we are printing its parents.
-        :type filename: State class
-        :param file: The name of the given file to print the moves.
-        :type filename: str
-        :return: Nothing
-        :rtype: None
-        """
-
-        output_file = open(file, "w")
-        # output_file.write("Depth: ")
-        # output_file.write(str(state.f))
-        # output_file.write("\n\n")
-        path = []
-        while state != None:
-            path.insert(0, state.board.grid)
-            state = state.parent
-        for step in path:
-            for i in range(self.board.height):
-                for j in range(self.board.width):
-                    output_file.write(step[i][j])
-                output_file.write("\n")
-            output_file.write("\n")
-    
-    # def print_board(self):
-    #     for i in range(self.board.height):
-    #         print(self.board.grid[i])
-    #     print('\n')
 
+exact_bound = 0
+lower_bound = 1 # The true value is at least the stored value
+upper_bound = 2 # The true value is at most the stored value
+transposition_table = TranspositionTable()
 
-def read_from_file(filename):
-    """
-    Load initial board from a given file.
 
-    :param filename: The name of the given file.
-    :type filename: str
-    :return: A loaded board
-    :rtype: Board
+class EvaluationCache:
+    """
+    Cache of leaf values by position key: the value quiescence finds for a
+    position at the depth limit, which is its evaluation unless the side to move
+    has a jump pending. The same leaves are reached by many move orders, and in the
+    next iterations and moves. Values of positions with a jump pending are found
+    by a search with a window, so like transposition table entries they may only
+    be bounds (see exact_bound).
+
+    Entries live in slots of preallocated arrays and are replaced with the clock
+    algorithm, an approximation of least-recently-used: a hit sets the reference
+    bit of its slot, and when a slot is needed the hand sweeps the slots in turn,
+    clearing set bits, and reuses the first slot whose bit was already clear. A
+    dict maps each cached key to its slot.
+
+    Values depend on the evaluation weights, so clear the cache after set_weights.
     """
 
-    puzzle_file = open(filename, "r")
-
-    line_index = 0
-    pieces = []
-    
-    for line in puzzle_file:
+    entry_bytes = 200 # Approximate size of one entry including its dict item and numbers
 
-        for x, ch in enumerate(line):
+    def __init__(self, size_mb=eval_cache_mb):
+        """
+        :param size_mb: The memory cap of the cache in megabytes (0 disables the cache).
+        :type size_mb: float
+        """
+        self.size_mb = size_mb
+        self.size = int(size_mb * 1024 * 1024) // self.entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.slots = {}
+        self.keys = [None] * self.size
+        self.values = [0.0] * self.size
+        self.bounds = bytearray(self.size)
+        self.referenced = bytearray(self.size)
+        self.hand = 0
+
+    def probe(self, key, alpha, beta):
+        """
+        Returns the value cached for a position key if it decides the value of the
+        position within a window, or None.
+
+        :param key: The position key from Board.position_key.
+        :type key: int
+        :param alpha: The value red is already sure of.
+        :type alpha: float
+        :param beta: The value black is already sure of.
+        :type beta: float
+        :rtype: Optional[float]
+        """
+        slot = self.slots.get(key)
+        if slot is not None:
+            value = self.values[slot]
+            bound = self.bounds[slot]
+            if bound == exact_bound or (bound == lower_bound and value >= beta) \
+                    or (bound == upper_bound and value <= alpha):
+                self.hits += 1
+                self.referenced[slot] = 1
+                return value
+        self.misses += 1
+        return None
+
+    def store(self, key, value, bound=exact_bound):
+        """
+        :param key: The position key from Board.position_key.
+        :type key: int
+        :param value: The leaf value of the position.
+        :type value: float
+        :param bound: exact_bound, lower_bound or upper_bound.
+        :type bound: int
+        """
+        if self.size == 0:
+            return
+        slot = self.slots.get(key)
+        if slot is None:
+            referenced = self.referenced
+            slot = self.hand
+            while referenced[slot]:
+                referenced[slot] = 0
+                slot += 1
+                if slot == self.size:
+                    slot = 0
+            old_key = self.keys[slot]
+            if old_key is not None:
+                del self.slots[old_key]
+            self.keys[slot] = key
+            self.slots[key] = slot
+            self.hand = slot + 1 if slot + 1 < self.size else 0
+        self.values[slot] = value
+        self.bounds[slot] = bound
+
+    def hit_rate(self):
+        """
+        :return: The share of probes answered from the cache since it was created, or None.
+        :rtype: Optional[float]
+        """
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else None
 
-            if ch == char_red_king: # found vertical piece
-                pieces.append(Piece(True, True, x, line_index))
-            elif ch == char_red_basic: # found horizontal piece
-                pieces.append(Piece(True, False, x, line_index))
-            elif ch == char_black_king:
-                pieces.append(Piece(False, True, x, line_index))
-            elif ch == char_black_basic:
-                pieces.append(Piece(False, False, x, line_index))
-        line_index += 1
 
-    puzzle_file.close()
+evaluation_cache = EvaluationCache()
 
-    board = Board(pieces)
-    
-    return board
 
-def read_from_input(board_grid):
+def current_rss_kb():
     """
-    Load initial board from a given file.
+    :return: The resident set size of this process in kilobytes, or None where it
+        cannot be read (it is read from /proc, which only Linux has).
+    :rtype: Optional[int]
+    """
+    try:
+        statm = open('/proc/self/statm', 'r')
+    except OSError:
+        return None
+    try:
+        resident_pages = int(statm.read().split()[1])
+    finally:
+        statm.close()
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def peak_rss_kb():
+    """
+    :return: The peak resident set size of this process in kilobytes, or None if unknown.
+    :rtype: Optional[int]
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # Reported in bytes on macOS
+        peak //= 1024
+    return peak
 
-    :param filename: The name of the given file.
-    :type filename: str
-    :return: A loaded board
-    :rtype: Board
+
+def process_memory_limit_kb():
     """
+    :return: The share of memory_limit_mb of this process in kilobytes, or None for no limit.
+    :rtype: Optional[float]
+    """
+    if memory_limit_mb is None:
+        return None
+    return memory_limit_mb * 1024 / memory_processes
 
-    line_index = 0
-    pieces = []
-    
-    for line in board_grid:
 
-        for x, ch in enumerate(line):
+def fit_memory_limit():
+    """
+    Cuts the memory caps of the transposition table and the evaluation cache,
+    which are the only structures sized by a setting, so that they fit within
+    this process's share of memory_limit_mb next to what the process already
+    uses and memory_reserve_mb for the search. Both keep their share of the
+    memory left. Call it once the tables are set up; tables that shrink are
+    replaced by empty ones. Warns if the resident set size cannot be measured,
+    as the limit is then not applied.
+    """
+    global transposition_table, evaluation_cache
+    limit_kb = process_memory_limit_kb()
+    if limit_kb is None:
+        return
+    rss = current_rss_kb()
+    if rss is None:
+        warnings.warn('the resident set size cannot be measured here, so the memory limit is not applied')
+        return
+    wanted = transposition_table.size_mb + evaluation_cache.size_mb
+    available = max(0.0, (limit_kb - rss) / 1024 - memory_reserve_mb)
+    if wanted > available:
+        scale = available / wanted
+        transposition_table = TranspositionTable(transposition_table.size_mb * scale)
+        evaluation_cache = EvaluationCache(evaluation_cache.size_mb * scale)
+
+
+memory_shrink_rss_kb = 0 # Resident set size when check_memory_limit last shrank the caches
+
+
+def check_memory_limit():
+    """
+    Halves the transposition table and the evaluation cache, emptying them, if
+    the process has grown beyond its share of memory_limit_mb, e.g. because the
+    cap of a table underestimates its entries. Python keeps much of the memory it
+    frees for reuse, so the resident set may not fall afterwards. The caches are
+    therefore only halved again once it grows beyond the size of the previous
+    halving. The workers of a parallel search check their own share after every
+    root move they search.
+
+    :return: True if the caches were halved.
+    :rtype: bool
+    """
+    global transposition_table, evaluation_cache, memory_shrink_rss_kb
+    limit_kb = process_memory_limit_kb()
+    if limit_kb is None:
+        return False
+    rss = current_rss_kb()
+    if rss is None or rss <= max(limit_kb, memory_shrink_rss_kb):
+        return False
+    memory_shrink_rss_kb = rss
+    transposition_table = TranspositionTable(transposition_table.size_mb / 2)
+    evaluation_cache = EvaluationCache(evaluation_cache.size_mb / 2)
+    return True
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the wall-clock deadline of the move has passed.
+    """
+    pass
 
-            if ch == char_red_king: # found vertical piece
-                pieces.append(Piece(True, True, x, line_index))
-            elif ch == char_red_basic: # found horizontal piece
-                pieces.append(Piece(True, False, x, line_index))
-            elif ch == char_black_king:
-                pieces.append(Piece(False, True, x, line_index))
-            elif ch == char_black_basic:
-                pieces.append(Piece(False, False, x, line_index))
-        line_index += 1
 
-    board = Board(pieces)
-    
-    return board
+class SearchControl:
+    """
+    Limits of the search that is currently running: the depth limit of the
+    current iterative deepening iteration and the wall-clock deadline.
+    """
 
+    def __init__(self):
+        self.depth_limit = depth_limit
+        self.deadline = None
+        self.nodes = 0
+        self.stop_nodes = float('inf') # Node count at which the search stops
+        self.root_move = None # Key of the best move of the previous iteration
+        # Positions of the game and of the current search path that can still repeat,
+        # and for each depth of the path the number of plies since a capture or a
+        # basic piece moved.
+        self.seen = set()
+        self.quiet_plies = [0] * (max_search_depth + 2)
+        # A move list per depth of the path, reused by every node at that depth.
+        self.move_buffers = [[] for depth in range(max_search_depth + 2)]
+
+    def start_search(self, state):
+        """
+        Prepares the repetition and no-progress tracking for a search of a state.
 
+        :param state: The root of the search.
+        :type state: State
+        """
+        self.seen = set(state.history)
+        self.seen.add(state.board.position_key(state.red_turn))
+        self.quiet_plies = [0] * (max(self.depth_limit, max_search_depth) + 2)
+        self.quiet_plies[1] = len(state.history)
+        while len(self.move_buffers) < len(self.quiet_plies):
+            self.move_buffers.append([])
+
+    def check_time(self):
+        """
+        Counts a node and raises SearchTimeout once the deadline has passed or the
+        node budget is spent. The clock is only read every 1024 nodes.
+        """
+        self.nodes += 1
+        if self.nodes >= self.stop_nodes:
+            raise SearchTimeout()
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+
+search_control = SearchControl()
+
+
+class MoveHistory:
+    """
+    What the search has learned about good moves, used to order the moves of later
+    nodes without evaluating their children: up to two killer moves per ply (quiet
+    moves that were recently best at that ply) and a history score per side and
+    (from square, to square) pair that grows each time a quiet move is best at a
+    node, more so the deeper the search below it was.
+    """
+
+    killer_slots = 2
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.killers = []
+        self.history = [[0] * (num_squares * num_squares) for side in range(2)]
+
+    def new_search(self):
+        """
+        Forgets the killers and halves the history scores before the search of a new
+        position, so the earlier moves of the game still count but less and less.
+        """
+        self.killers = []
+        for scores in self.history:
+            for index in range(len(scores)):
+                scores[index] >>= 1
+
+    def ply_killers(self, depth):
+        if depth < len(self.killers):
+            return self.killers[depth]
+        return ()
+
+    def record_best_move(self, move, depth, draft):
+        """
+        Records a move that caused a cutoff or was the best move of a node whose
+        value is exact. Captures are ordered first anyway, so only quiet moves are
+        recorded.
+
+        :param move: The move, or None if the node had no move to search.
+        :type move: Optional[Move]
+        :param depth: The depth of the node it was played from.
+        :type depth: int
+        :param draft: The number of plies that were left to search below that node.
+        :type draft: int
+        """
+        if move is None or move.captures:
+            return
+        while len(self.killers) <= depth:
+            self.killers.append([None] * self.killer_slots)
+        killers = self.killers[depth]
+        if killers[0] != move.key:
+            killers[1:] = killers[:-1]
+            killers[0] = move.key
+        self.history[move.red_turn][move.from_square * num_squares + move.to_square] += draft * draft
+
+
+move_history = MoveHistory()
+
+
+def clear_search_tables():
+    """
+    Empties the transposition table, evaluation cache and move ordering history,
+    so that the next search starts without results of earlier ones.
+    """
+    transposition_table.clear()
+    evaluation_cache.clear()
+    move_history.clear()
+
+
+def move_time_budget(game_elapsed_ms):
+    """
+    Returns the time budget for the next move from the per-move and per-game limits.
+
+    :param game_elapsed_ms: The time already used by the game in milliseconds.
+    :type game_elapsed_ms: float
+    :return: The budget in milliseconds, or None to search to depth_limit.
+    :rtype: Optional[float]
+    """
+    budget = move_time_ms
+    if game_time_ms is not None:
+        share = max(1, (game_time_ms - game_elapsed_ms) / game_time_share)
+        if budget is None or share < budget:
+            budget = share
+    return budget
+
+
+class SearchStats:
+    """
+    Counters describing what the search did. The search only updates them when the
+    module-level search_stats is set to an instance, so they cost nothing otherwise.
+
+    Use from Python:
+        search_stats = SearchStats()  (assigned to checkers.search_stats)
+        state.alpha_beta_prune()
+        search_stats.last_report      (a dict, see end_move)
+    """
+
+    def __init__(self, output=None):
+        """
+        :param output: Optional open file that receives one JSON line per move.
+        :type output: Optional[file]
+        """
+        self.output = output
+        self.moves_reported = 0
+        self.last_report = None
+        self.reset()
+
+    def reset(self):
+        self.interior_nodes = 0
+        self.leaf_nodes = 0
+        self.quiescence_nodes = 0
+        self.tt_cutoffs = 0
+        self.tablebase_hits = 0
+        self.eval_cache_hits = 0
+        self.moves_generated = 0
+        self.children_searched = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.researches = 0
+        self.aspiration_researches = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        self.futility_prunes = 0
+        self.move_finder_seconds = 0.0
+        self.ordering_seconds = 0.0
+        self.evaluation_seconds = 0.0
+        self.iterations = []
+
+    def nodes(self):
+        return self.interior_nodes + self.quiescence_nodes + self.leaf_nodes + self.tt_cutoffs + self.tablebase_hits \
+            + self.eval_cache_hits
+
+    def leaf_evaluation(self, board):
+        self.leaf_nodes += 1
+        start = time.perf_counter()
+        value = board.evaluation_fcn()
+        self.evaluation_seconds += time.perf_counter() - start
+        return value
+
+    def timed_move_finder(self, state, moves=None):
+        self.interior_nodes += 1
+        start = time.perf_counter()
+        moves = state.move_finder(moves)[0]
+        self.move_finder_seconds += time.perf_counter() - start
+        self.moves_generated += len(moves)
+        return moves
+
+    def timed_sort_moves(self, state, moves, tt_move, depth):
+        start = time.perf_counter()
+        state.sort_moves(moves, tt_move, depth)
+        self.ordering_seconds += time.perf_counter() - start
+
+    def record_children(self, searched, cutoff):
+        """
+        Records the children searched below an interior node.
+
+        :param searched: The number of children searched.
+        :type searched: int
+        :param cutoff: True if the node was cut off after the last of them.
+        :type cutoff: bool
+        """
+        self.children_searched += searched
+        if cutoff:
+            self.cutoffs += 1
+            if searched == 1:
+                self.first_move_cutoffs += 1
+
+    def record_iteration(self, limit, seconds):
+        self.iterations.append({'depth': limit - 1, 'nodes': self.nodes(), 'seconds': seconds})
+
+    def end_move(self, state, move, seconds):
+        """
+        Builds the report of one move, writes it to the output file if there is one,
+        and resets the counters for the next move.
+
+        :param state: The state the move was chosen for.
+        :type state: State
+        :param move: The move that was chosen.
+        :type move: Move
+        :param seconds: The time taken to choose it.
+        :type seconds: float
+        :return: The report.
+        :rtype: Dict
+        """
+        nodes = self.nodes()
+        depth = self.iterations[-1]['depth'] if self.iterations else 0
+        report = {
+            'move': self.moves_reported,
+            'side': 'red' if state.red_turn else 'black',
+            'path': [square_coords[square] for square in move.path],
+            'depth': depth,
+            'seconds': seconds,
+            'nodes': nodes,
+            'nodes_per_second': nodes / seconds if seconds > 0 else None,
+            'interior_nodes': self.interior_nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'leaf_nodes': self.leaf_nodes,
+            'tt_cutoffs': self.tt_cutoffs,
+            'tablebase_hits': self.tablebase_hits,
+            'eval_cache_hits': self.eval_cache_hits,
+            'eval_cache_hit_rate': evaluation_cache.hit_rate(),
+            'cutoffs': self.cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else None,
+            'researches': self.researches,
+            'aspiration_researches': self.aspiration_researches,
+            'reductions': self.reductions,
+            'reduction_researches': self.reduction_researches,
+            'futility_prunes': self.futility_prunes,
+            'legal_branching_factor': self.moves_generated / self.interior_nodes if self.interior_nodes else None,
+            'searched_branching_factor': self.children_searched / self.interior_nodes if self.interior_nodes else None,
+            'effective_branching_factor': nodes ** (1 / depth) if depth > 0 and nodes > 0 else None,
+            'move_finder_seconds': self.move_finder_seconds,
+            'ordering_seconds': self.ordering_seconds,
+            'evaluation_seconds': self.evaluation_seconds,
+            'iterations': self.iterations,
+            'rss_kb': current_rss_kb(),
+            'peak_rss_kb': peak_rss_kb(),
+            'tt_mb': transposition_table.size_mb,
+            'eval_cache_mb': evaluation_cache.size_mb,
+        }
+        self.moves_reported += 1
+        self.last_report = report
+        if self.output is not None:
+            self.output.write(json.dumps(report) + "\n")
+            self.output.flush()
+        self.reset()
+        return report
+
+
+search_stats = None # The SearchStats updated by the search, or None to collect nothing
+
+
+class SortedRecordFile:
+    """
+    Read-only file of fixed-size records sorted by a 64-bit position key. The file
+    is memory-mapped and searched with a binary search, so lookups need no parsing
+    up front and processes opening the same file share it through the page cache.
+
+    Layout: a header (magic, version, info, record count) followed by the records.
+    """
+
+    header = struct.Struct('<4sHHI')
+    version = 1
+
+    def __init__(self, filename, magic, record):
+        """
+        :param filename: The file to open.
+        :type filename: str
+        :param magic: The four bytes identifying the kind of file.
+        :type magic: bytes
+        :param record: The layout of a record; its first field is the key.
+        :type record: struct.Struct
+        """
+        self.filename = filename
+        self.record = record
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (file_magic, version, self.info, self.count) = self.header.unpack_from(self.data, 0)
+        if file_magic != magic or version != self.version:
+            self.close()
+            raise ValueError('{} is not a {} file of version {}'.format(filename, magic.decode(), self.version))
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def find(self, key):
+        """
+        Returns the record with a key, or None if there is none.
+
+        :param key: The position key.
+        :type key: int
+        :rtype: Optional[Tuple]
+        """
+        low = 0
+        high = self.count
+        size = self.record.size
+        offset = self.header.size
+        while low < high:
+            middle = (low + high) // 2
+            record = self.record.unpack_from(self.data, offset + middle * size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def __iter__(self):
+        """
+        Reads the records in order of their keys.
+        """
+        size = self.record.size
+        offset = self.header.size
+        for index in range(self.count):
+            yield self.record.unpack_from(self.data, offset + index * size)
+
+
+def write_sorted_records(filename, magic, record, info, records, presorted=False):
+    """
+    Writes records to a file that SortedRecordFile can open.
+
+    :param filename: The file to write.
+    :type filename: str
+    :param magic: The four bytes identifying the kind of file.
+    :type magic: bytes
+    :param record: The layout of a record; its first field is the key.
+    :type record: struct.Struct
+    :param info: A number describing the contents, stored in the header.
+    :type info: int
+    :param records: The records as tuples. Keys must be unique.
+    :type records: List[Tuple]
+    :param presorted: True if records is an iterable already in order of keys,
+        which is then written as it is read instead of being sorted in memory.
+    :type presorted: bool
+    :return: The number of records written.
+    :rtype: int
+    """
+    if not presorted:
+        records = sorted(records)
+    output_file = open(filename, "wb")
+    output_file.write(SortedRecordFile.header.pack(magic, SortedRecordFile.version, info, 0))
+    count = 0
+    for fields in records:
+        output_file.write(record.pack(*fields))
+        count += 1
+    # The count is only known at the end when the records are streamed.
+    output_file.seek(0)
+    output_file.write(SortedRecordFile.header.pack(magic, SortedRecordFile.version, info, count))
+    output_file.close()
+    return count
+
+
+tablebase_loss = 0
+tablebase_draw = 1
+tablebase_win = 2
+tablebase_win_score = 1000 # Value of a won position, less one point per ply to the win
+
+
+class Tablebase(SortedRecordFile):
+    """
+    Endgame tablebase written by tablebase.py. For every position with at most
+    max_pieces pieces it records whether the side to move wins, loses or draws
+    with best play, and in how many plies the game ends when it is not a draw.
+    """
+
+    magic = b'CKTB'
+    record = struct.Struct('<QBH') # Position key, result for the side to move, plies to the end
+
+    def __init__(self, filename):
+        """
+        :param filename: The tablebase file.
+        :type filename: str
+        """
+        SortedRecordFile.__init__(self, filename, self.magic, self.record)
+        self.max_pieces = self.info
+
+    def probe(self, board, red_turn):
+        """
+        Looks up a position and converts the result to an evaluation, positive
+        when red wins. Quicker wins and slower losses score better.
+
+        :param board: The board to look up.
+        :type board: Board
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :return: The value of the position, or None if it is not in the tablebase.
+        :rtype: Optional[float]
+        """
+        record = self.find(board.position_key(red_turn))
+        if record is None:
+            return None
+        (key, result, distance) = record
+        if result == tablebase_draw:
+            return 0
+        value = tablebase_win_score - distance
+        if (result == tablebase_win) != red_turn:
+            value = -value
+        return value
+
+
+tablebase = None # The Tablebase probed by the search, or None
+
+
+class Book(SortedRecordFile):
+    """
+    Position book written by book.py: the best move of each of a set of positions,
+    found offline by a deep search.
+    """
+
+    magic = b'CKBK'
+    record = struct.Struct('<QQB') # Position key, key of the best move, depth it was searched to
+
+    def __init__(self, filename):
+        """
+        :param filename: The book file.
+        :type filename: str
+        """
+        SortedRecordFile.__init__(self, filename, self.magic, self.record)
+
+    def probe(self, board, red_turn, moves):
+        """
+        Looks up the best move of a position.
+
+        :param board: The board to look up.
+        :type board: Board
+        :param red_turn: True if it is the red player's turn.
+        :type red_turn: bool
+        :param moves: The legal moves of the position.
+        :type moves: List[Move]
+        :return: The move from the book, or None if the position is not in the book.
+        :rtype: Optional[Move]
+        """
+        record = self.find(board.position_key(red_turn))
+        if record is None:
+            return None
+        for move in moves:
+            if move.key == record[1]:
+                return move
+        return None
+
+
+book = None # The Book consulted before searching, or None
+
+
+# Packed position files: a SortedRecordFile header with the magic below followed by
+# one record per position, in the order they were written.
+position_magic = b'CKPS'
+position_record = struct.Struct('<IIIIB') # red_men, red_kings, black_men, black_kings, red_turn
+dark_squares = frozenset(square_coords)
+
+
+def board_position(board, red_turn):
+    """
+    :return: The packed position of a board: (red_men, red_kings, black_men, black_kings, red_turn).
+    :rtype: Tuple[int, int, int, int, bool]
+    """
+    return (board.red_men, board.red_kings, board.black_men, board.black_kings, red_turn)
+
+
+def position_grid(position):
+    """
+    :param position: A packed position.
+    :type position: Tuple[int, int, int, int, bool]
+    :return: The rows of the board in the read_from_input format.
+    :rtype: List[str]
+    """
+    return [''.join(row) for row in Board((), *position[:4]).grid]
+
+
+def grid_position(grid, red_turn=True):
+    """
+    Packs a board grid in the read_from_input format. Only grids that pack
+    losslessly are accepted: 8 rows of 8 squares, with pieces on dark squares only.
+
+    :param grid: The rows of the board.
+    :type grid: List[str]
+    :param red_turn: True if it is the red player's turn.
+    :type red_turn: bool
+    :rtype: Tuple[int, int, int, int, bool]
+    """
+    if len(grid) != 8 or any(len(row) != 8 for row in grid):
+        raise ValueError('the grid must have 8 rows of 8 squares')
+    for (y_coord, row) in enumerate(grid):
+        for (x_coord, char) in enumerate(row):
+            if char == empty_slot:
+                continue
+            if char not in valid_red and char not in valid_black:
+                raise ValueError('unknown square {!r} in row {}'.format(char, y_coord))
+            if (x_coord, y_coord) not in dark_squares:
+                raise ValueError('piece on the light square ({}, {})'.format(x_coord, y_coord))
+    return board_position(read_from_input(grid), red_turn)
+
+
+def read_grid_positions(lines):
+    """
+    Reads the positions of a text corpus: blocks of 8 rows in the read_from_input
+    format, each optionally followed by a line "red" or "black" naming the side to
+    move (red if left out, as for puzzle files), separated by blank lines. A puzzle
+    file is a corpus of one position.
+
+    :param lines: The lines of the corpus.
+    :type lines: Iterable[str]
+    :return: The packed positions, in order.
+    :rtype: Iterator[Tuple[int, int, int, int, bool]]
+    """
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line in ('red', 'black') and len(rows) == 8:
+            yield grid_position(rows, line == 'red')
+            rows = []
+        elif line:
+            if len(rows) == 8:
+                yield grid_position(rows)
+                rows = []
+            rows.append(line)
+        elif rows:
+            yield grid_position(rows)
+            rows = []
+    if rows:
+        yield grid_position(rows)
+
+
+def write_grid_positions(output_file, positions):
+    """
+    Writes positions as a text corpus that read_grid_positions reads back.
+
+    :param output_file: The open text file.
+    :type output_file: IO[str]
+    :param positions: The packed positions.
+    :type positions: Iterable[Tuple[int, int, int, int, bool]]
+    """
+    for position in positions:
+        output_file.write("\n".join(position_grid(position)))
+        output_file.write("\nred\n\n" if position[4] else "\nblack\n\n")
+
+
+def position_count(header_bytes, file_size, filename):
+    """
+    Checks the header of a packed position file against its size.
+
+    :return: The number of positions in the file.
+    :rtype: int
+    """
+    header = SortedRecordFile.header
+    if len(header_bytes) < header.size:
+        raise ValueError('{} is not a {} file'.format(filename, position_magic.decode()))
+    (magic, version, info, count) = header.unpack_from(header_bytes, 0)
+    if magic != position_magic or version != SortedRecordFile.version:
+        raise ValueError('{} is not a {} file of version {}'.format(filename, position_magic.decode(),
+                                                                    SortedRecordFile.version))
+    if file_size != header.size + count * position_record.size:
+        raise ValueError('{} should hold {} positions but is truncated or was not closed'.format(filename, count))
+    return count
+
+
+class PositionWriter:
+    """
+    Writes a packed position file one position at a time. Records are buffered, so
+    writing millions of positions takes few system calls. The record count in the
+    header is filled in by close, which the with statement calls.
+    """
+
+    buffer_records = 4096
+
+    def __init__(self, filename):
+        """
+        :param filename: The file to write.
+        :type filename: str
+        """
+        self.file = open(filename, "wb")
+        self.file.write(SortedRecordFile.header.pack(position_magic, SortedRecordFile.version, 0, 0))
+        self.buffer = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, position):
+        """
+        :param position: (red_men, red_kings, black_men, black_kings, red_turn)
+        :type position: Tuple[int, int, int, int, bool]
+        """
+        self.buffer.append(position_record.pack(*position))
+        self.count += 1
+        if len(self.buffer) >= self.buffer_records:
+            self.flush()
+
+    def write_board(self, board, red_turn):
+        self.write(board_position(board, red_turn))
+
+    def flush(self):
+        self.file.write(b''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.seek(0)
+        self.file.write(SortedRecordFile.header.pack(position_magic, SortedRecordFile.version, 0, self.count))
+        self.file.close()
+
+
+def read_positions(filename, chunk_records=65536):
+    """
+    Streams the positions of a packed position file in order, reading it in large
+    chunks. red_turn is read back as 1 or 0.
+
+    :param filename: The file to read.
+    :type filename: str
+    :param chunk_records: The number of records read at a time.
+    :type chunk_records: int
+    :rtype: Iterator[Tuple[int, int, int, int, int]]
+    """
+    position_file = open(filename, "rb")
+    try:
+        position_count(position_file.read(SortedRecordFile.header.size), os.fstat(position_file.fileno()).st_size,
+                       filename)
+        while True:
+            chunk = position_file.read(chunk_records * position_record.size)
+            if not chunk:
+                break
+            yield from position_record.iter_unpack(chunk)
+    finally:
+        position_file.close()
+
+
+class PositionFile:
+    """
+    Random access to the positions of a packed position file. The file is
+    memory-mapped, so opening it reads nothing up front and processes opening the
+    same file share it through the page cache. red_turn is read back as 1 or 0.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: The file to open.
+        :type filename: str
+        """
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.count = position_count(self.data, len(self.data), filename)
+        except ValueError:
+            self.close()
+            raise
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """
+        :param index: The number of the position in the file; negative numbers count from the end.
+        :type index: int
+        :rtype: Tuple[int, int, int, int, int]
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('position index out of range')
+        return position_record.unpack_from(self.data, SortedRecordFile.header.size + index * position_record.size)
+
+    def state(self, index):
+        """
+        :return: A State for the position with a number, ready to search.
+        :rtype: State
+        """
+        position = self[index]
+        return State(Board((), *position[:4]), bool(position[4]))
+
+
+class State:
+    """
+    State class wrapping a Board with some extra current state information.
+    Note that State and Board are different. Board has the locations of the pieces. 
+    State has a Board and some extra information that is relevant to the search: 
+    heuristic function, f value and current depth.
+    """
+
+    __slots__ = ('board', 'red_turn', 'plies', 'history')
+
+    def __init__(self, board, red_turn = True, plies=0, history=()):
+        """
+        :param board: The board of the state.
+        :type board: Board
+        :param plies: The number of moves played in the game before this state.
+        :type plies: int
+        :param history: The position keys of the game since the last capture or move
+            of a basic piece, oldest first and not including this state.
+        :type history: Tuple[int]
+        """
+        self.board = board
+        self.red_turn = red_turn
+        self.plies = plies
+        self.history = history
+
+    def play(self, move):
+        """
+        :param move: A legal move of the side to move.
+        :type move: Move
+        :return: The state of the game after the move.
+        :rtype: State
+        """
+        next_board = self.board.copy()
+        next_board.make(move)
+        if move.irreversible:
+            history = ()
+        else:
+            history = self.history + (self.board.position_key(self.red_turn),)
+        return State(next_board, not self.red_turn, self.plies + 1, history)
+
+    def is_draw(self):
+        """
+        :return: True if the game is drawn, because the position has occurred
+            repetitions_for_draw times or no_progress_limit plies went by without
+            a capture or a move of a basic piece.
+        :rtype: bool
+        """
+        if len(self.history) >= no_progress_limit:
+            return True
+        key = self.board.position_key(self.red_turn)
+        return self.history.count(key) + 1 >= repetitions_for_draw
+    
+    def move_finder(self, moves=None):
+        '''
+        Finds all moves of the player whose turn it is (see Board.generate_moves),
+        into the list moves if one is given.
+
+        returns:
+        Jump moves with True if there are possible jump moves
+        Regular moves with False if there are no jump moves 
+                
+        '''
+        return self.board.generate_moves(self.red_turn, moves)
+
+    def alpha_beta_prune(self, time_budget_ms=None):
+        """
+        Chooses and plays the move of the side to move.
+
+        :param time_budget_ms: Wall-clock budget for the move, or None to search to depth_limit.
+        :type time_budget_ms: Optional[float]
+        :return: The state after the chosen move.
+        :rtype: State
+        """
+        global stalemate
+        best_move = self.choose_move(time_budget_ms)
+        if best_move is None:
+            stalemate = True
+            return self
+        return self.play(best_move)
+
+    def choose_move(self, time_budget_ms=None):
+        """
+        Chooses the move of the side to move without playing it.
+
+        :param time_budget_ms: Wall-clock budget for the move, or None to search to depth_limit.
+        :type time_budget_ms: Optional[float]
+        :return: The chosen move, or None if the game is over: a side has no pieces
+            left or the side to move has no legal move.
+        :rtype: Optional[Move]
+        """
+        start = time.perf_counter()
+        if self.board.pieces_check_end_game():
+            return None
+        moves = self.move_finder()[0]
+        if len(moves) == 0:
+            return None
+        best_move = None
+        if len(moves) == 1:
+            best_move = moves[0]
+        elif book is not None:
+            best_move = book.probe(self.board, self.red_turn, moves)
+        if best_move is None:
+            best_move = self.iterative_deepening(time_budget_ms)
+        if search_stats is not None:
+            search_stats.end_move(self, best_move, time.perf_counter() - start)
+        check_memory_limit()
+        return best_move
+
+    def iterative_deepening(self, time_budget_ms=None):
+        """
+        Searches one ply deeper at a time, starting each iteration with the best
+        move of the previous one, until the time budget or the move_node_limit
+        budget runs out. The move of the deepest completed iteration is returned.
+        Without either budget a single search to depth_limit is made.
+
+        :param time_budget_ms: Wall-clock budget for the search, or None.
+        :type time_budget_ms: Optional[float]
+        :return: The best move found.
+        :rtype: Move
+        """
+        start = time.perf_counter()
+        deadline = None if time_budget_ms is None else start + time_budget_ms / 1000
+        stop_nodes = float('inf') if move_node_limit is None else search_control.nodes + move_node_limit
+        if deadline is None and move_node_limit is None:
+            first_depth = depth_limit
+            last_depth = depth_limit
+        else:
+            first_depth = 2
+            last_depth = max_search_depth
+        # The search makes and unmakes moves on a single working copy of the board.
+        search_state = State(self.board.copy(), self.red_turn, self.plies, self.history)
+        best_move = None
+        values = [] # Value of each completed iteration
+        search_control.root_move = None
+        move_history.new_search()
+        for limit in range(first_depth, last_depth + 1):
+            search_control.depth_limit = limit
+            search_control.start_search(search_state)
+            # The first iteration always completes so that there is a move to play.
+            search_control.deadline = deadline if best_move is not None else None
+            search_control.stop_nodes = stop_nodes if best_move is not None else float('inf')
+            try:
+                if parallel_search is not None:
+                    (best_move, value) = parallel_search.search(search_state, limit, search_control.deadline)
+                else:
+                    # Evaluations swing between odd and even depths, as one side or the
+                    # other has had the last move, so the value expected from this
+                    # iteration is that of the iteration two plies shallower.
+                    guess = values[-2] if len(values) >= 2 else None
+                    (best_move, value) = search_state.aspiration_search(guess)
+            except SearchTimeout:
+                break
+            values.append(value)
+            search_control.root_move = best_move.key
+            if search_stats is not None:
+                search_stats.record_iteration(limit, time.perf_counter() - start)
+            if value == utility or value == neg_utility:
+                break
+            # An iteration costs more than all the previous ones together, so do not
+            # start one that is unlikely to finish.
+            if deadline is not None and time.perf_counter() - start > (deadline - start) / 2:
+                break
+            if search_control.nodes >= stop_nodes:
+                break
+        search_control.deadline = None
+        search_control.stop_nodes = float('inf')
+        search_control.root_move = None
+        return best_move
+    
+    def aspiration_search(self, guess=None):
+        """
+        Searches the root with a window of aspiration_window either side of a guess
+        of its value from an earlier iteration. A narrow window prunes more, but if
+        the value falls outside it the search only returns a bound, so the root is
+        searched again with that side of the window opened.
+
+        :param guess: The expected value of the root, or None for a full window.
+        :type guess: Optional[float]
+        :return: The best move and its value.
+        :rtype: Tuple[Move, float]
+        """
+        if guess is None or guess == utility or guess == neg_utility:
+            (alpha, beta) = (neg_utility, utility)
+        else:
+            (alpha, beta) = (guess - aspiration_window, guess + aspiration_window)
+        while True:
+            if self.red_turn:
+                (best_move, value) = self.MAX_VALUE(alpha, beta, 1)
+            else:
+                (best_move, value) = self.MIN_VALUE(alpha, beta, 1)
+            if value <= alpha and alpha != neg_utility:
+                alpha = neg_utility
+            elif value >= beta and beta != utility:
+                beta = utility
+            else:
+                return (best_move, value)
+            if search_stats is not None:
+                search_stats.aspiration_researches += 1
+
+    def order_moves(self, moves, tt_move=None, depth=1):
+        """
+        Node ordering: the move whose key is tt_move (the best move of an earlier
+        search) first, then captures by the number of pieces taken, then promotions,
+        then the killer moves of the ply, then the other moves by their history score
+        (see MoveHistory).
+        No child is evaluated. With static_ordering the moves are sorted by the
+        evaluation of their children instead (see static_order_moves).
+
+        :param moves: The moves from this state.
+        :type moves: List[Move]
+        :param tt_move: The key of the move to try first, or None.
+        :type tt_move: Optional[int]
+        :param depth: The depth of this state in the search, which selects the killer moves.
+        :type depth: int
+        :return: The moves in the order they should be searched.
+        :rtype: List[Move]
+        """
+        ordered = list(moves)
+        self.sort_moves(ordered, tt_move, depth)
+        return ordered
+
+    def sort_moves(self, moves, tt_move=None, depth=1):
+        """
+        Sorts a list of moves in place into the order of order_moves, so that the
+        search can keep reusing the move buffer of each ply.
+        """
+        if static_ordering:
+            moves[:] = self.static_order_moves(moves, tt_move)
+            return
+        killers = move_history.ply_killers(depth)
+        history = move_history.history[self.red_turn]
+        moves.sort(key=lambda move: (move.key != tt_move, -move.captures, not move.promotion, move.key not in killers,
+                                     -history[move.from_square * num_squares + move.to_square]))
+
+    def static_order_moves(self, moves, tt_move=None):
+        """
+        Sorts moves by the evaluation of the board each one leads to, best for the
+        side to move first, using a priority queue. The move whose key is tt_move is
+        always tried first.
+
+        :param moves: The moves from this state.
+        :type moves: List[Move]
+        :param tt_move: The key of the move to try first, or None.
+        :type tt_move: Optional[int]
+        :return: The moves in the order they should be searched.
+        :rtype: List[Move]
+        """
+        board = self.board
+        sign = -1 if self.red_turn else 1
+        pq = []
+        for index, move in enumerate(moves):
+            board.make(move)
+            heappush(pq, (move.key != tt_move, board.evaluation_fcn() * sign, index, move))
+            board.unmake(move)
+        ordered = []
+        while len(pq) > 0:
+            ordered.append(heappop(pq)[3])
+        return ordered
+
+    def quiescence(self, alpha, beta):
+        """
+        Value of a state at the depth limit. Evaluating a position in the middle of
+        an exchange misjudges it, so while the side to move has a jump it must make,
+        every jump is searched (jumps only, as no other move is legal) and the
+        position is evaluated once no jump is pending. Every jump removes a piece,
+        so this always ends. Exact values are kept in the evaluation_cache.
+
+        :param alpha: The value red is already sure of.
+        :type alpha: float
+        :param beta: The value black is already sure of.
+        :type beta: float
+        :return: The value of the state.
+        :rtype: float
+        """
+        board = self.board
+        stats = search_stats
+        cache = evaluation_cache
+        if cache.size:
+            key = board.position_key(self.red_turn)
+            value = cache.probe(key, alpha, beta)
+            if value is not None:
+                if stats is not None:
+                    stats.eval_cache_hits += 1
+                return value
+        if quiescence_search and not board.pieces_check_end_game() and board.has_jump(self.red_turn):
+            if stats is not None:
+                stats.quiescence_nodes += 1
+            child = State(board, not self.red_turn)
+            (alpha_orig, beta_orig) = (alpha, beta)
+            v = neg_utility if self.red_turn else utility
+            for move in sorted(self.move_finder()[0], key=lambda move: -move.captures):
+                search_control.check_time()
+                board.make(move)
+                value = child.quiescence(alpha, beta)
+                board.unmake(move)
+                if self.red_turn:
+                    v = max(v, value)
+                    if v >= beta:
+                        break
+                    alpha = max(alpha, v)
+                else:
+                    v = min(v, value)
+                    if v <= alpha:
+                        break
+                    beta = min(beta, v)
+            if cache.size:
+                if v <= alpha_orig:
+                    cache.store(key, v, upper_bound)
+                elif v >= beta_orig:
+                    cache.store(key, v, lower_bound)
+                else:
+                    cache.store(key, v)
+            return v
+        if stats is not None:
+            value = stats.leaf_evaluation(board)
+        else:
+            value = board.evaluation_fcn()
+        if cache.size:
+            cache.store(key, value)
+        return value
+
+    def frontier_values(self, moves, depth):
+        """
+        Evaluates the children of a node just above the depth limit with a single
+        evaluate_batch call. Drawn children get draw_value, and children where a
+        jump is pending still need the quiescence search, so they are left out.
+
+        :param moves: The moves of the node, in the order they will be searched.
+        :type moves: List[Move]
+        :param depth: The depth of the node.
+        :type depth: int
+        :return: The value of each child, or None where it has to be searched.
+        :rtype: List[Optional[float]]
+        """
+        board = self.board
+        seen = search_control.seen
+        quiet_plies = search_control.quiet_plies[depth]
+        positions = []
+        kinds = [] # True for a child in the batch, False for one to search, or its draw value
+        for move in moves:
+            board.make(move)
+            if board.position_key(not self.red_turn) in seen \
+                    or (not move.irreversible and quiet_plies + 1 >= no_progress_limit):
+                kinds.append(draw_value)
+            elif board.pieces_check_end_game() or not (quiescence_search and board.has_jump(not self.red_turn)):
+                positions.append((board.red_men, board.red_kings, board.black_men, board.black_kings))
+                kinds.append(True)
+            else:
+                kinds.append(False)
+            board.unmake(move)
+        if search_stats is not None:
+            search_stats.leaf_nodes += len(positions)
+            start = time.perf_counter()
+            values = iter(evaluate_batch(positions))
+            search_stats.evaluation_seconds += time.perf_counter() - start
+        else:
+            values = iter(evaluate_batch(positions))
+        return [next(values) if kind is True else None if kind is False else kind for kind in kinds]
+
+    def quiet_child(self, move, depth):
+        """
+        Tells whether the child a move leads to is quiet enough for a selective
+        search to reduce or prune it: the move captures and promotes nothing, and
+        the opponent has no jump to make, but has a move, and the child is not a
+        draw. Call with the move made on the board.
+
+        :param move: The move just made.
+        :type move: Move
+        :param depth: The depth of this state in the search.
+        :type depth: int
+        :rtype: bool
+        """
+        if move.captures or move.promotion:
+            return False
+        board = self.board
+        opponent = not self.red_turn
+        if board.has_jump(opponent) or not board.has_step(opponent):
+            return False
+        return board.position_key(opponent) not in search_control.seen \
+            and (move.irreversible or search_control.quiet_plies[depth] + 1 < no_progress_limit)
+
+    def selective_value(self, child, move, searched, alpha, beta, depth, draft):
+        """
+        Selective search of a move after the first of a node, made on the board.
+        Moves that capture or promote, and quiet_child's other exceptions, are never
+        reduced or pruned.
+        Futility pruning: within futility_draft plies of the leaves, a quiet move
+        whose evaluation is more than futility_margin short of the window is not
+        searched, as the search is not expected to gain that much.
+        Late move reduction: after the first late_move_count moves, a quiet move is
+        searched a ply shallower with a null window, and only if it turns out better
+        than the best move so far is it searched again to full depth.
+
+        :param child: The state of the child, sharing this state's board.
+        :type child: State
+        :param move: The move just made.
+        :type move: Move
+        :param searched: The position of the move in the search order, from 1.
+        :type searched: int
+        :param draft: The depth left below this state.
+        :type draft: int
+        :return: A bound on the value of the move that does not change the result
+            of the node, or None if the move has to be searched in full.
+        :rtype: Optional[float]
+        """
+        futile = futility_margin is not None and draft <= futility_draft
+        late = searched > late_move_count and draft >= late_move_draft
+        if not (futile or late) or not self.quiet_child(move, depth):
+            return None
+        stats = search_stats
+        if futile:
+            if self.red_turn:
+                bound = self.board.evaluation_fcn() + futility_margin
+                pruned = bound <= alpha
+            else:
+                bound = self.board.evaluation_fcn() - futility_margin
+                pruned = bound >= beta
+            if pruned:
+                if stats is not None:
+                    stats.futility_prunes += 1
+                return bound
+        if not late:
+            return None
+        if stats is not None:
+            stats.reductions += 1
+        search_control.depth_limit -= 1
+        if self.red_turn:
+            value = child.MIN_VALUE(alpha, alpha + null_window, depth + 1)[1]
+            failed = value > alpha
+        else:
+            value = child.MAX_VALUE(beta - null_window, beta, depth + 1)[1]
+            failed = value < beta
+        search_control.depth_limit += 1
+        if failed:
+            if stats is not None:
+                stats.reduction_researches += 1
+            return None
+        return value
+
+    def MAX_VALUE(self, alpha, beta, depth):
+        search_control.check_time()
+        stats = search_stats
+        board = self.board
+        key = board.position_key(self.red_turn)
+        seen = search_control.seen
+        quiet_plies = search_control.quiet_plies
+        if depth > 1 and (key in seen or quiet_plies[depth] >= no_progress_limit):
+            return (None, draw_value)
+        if depth == search_control.depth_limit or board.pieces_check_end_game():
+            return (None, self.quiescence(alpha, beta))
+        if tablebase is not None and depth > 1 and board.piece_count() <= tablebase.max_pieces:
+            value = tablebase.probe(board, self.red_turn)
+            if value is not None:
+                if stats is not None:
+                    stats.tablebase_hits += 1
+                return (None, value)
+        draft = search_control.depth_limit - depth
+        entry = transposition_table.probe(key)
+        tt_move = search_control.root_move if depth == 1 else None
+        if entry is not None:
+            tt_move = entry[4]
+            if depth > 1 and entry[1] >= draft:
+                if entry[3] == exact_bound or (entry[3] == lower_bound and entry[2] >= beta) \
+                        or (entry[3] == upper_bound and entry[2] <= alpha):
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return (None, entry[2])
+        alpha_orig = alpha
+        v = float('-inf')
+        best_move = None
+        # The moves are generated and sorted in the buffer of this ply.
+        ordered = search_control.move_buffers[depth]
+        if stats is not None:
+            stats.timed_move_finder(self, ordered)
+            stats.timed_sort_moves(self, ordered, tt_move, depth)
+        else:
+            self.move_finder(ordered)
+            self.sort_moves(ordered, tt_move, depth)
+        child = State(board, not self.red_turn)
+        frontier = None
+        if batch_evaluation and depth + 1 == search_control.depth_limit:
+            frontier = self.frontier_values(ordered, depth)
+        # Late moves are searched selectively below the root, once a move better than
+        # a loss has been found.
+        selective = selective_search and depth > 1
+        if depth > 1: # The root position is already in seen
+            seen.add(key)
+        for searched, action in enumerate(ordered, 1):
+            quiet_plies[depth + 1] = 0 if action.irreversible else quiet_plies[depth] + 1
+            if frontier is not None and frontier[searched - 1] is not None:
+                search_control.check_time()
+                min_val = frontier[searched - 1]
+            else:
+                board.make(action)
+                min_val = None
+                if selective and searched > 1 and alpha != neg_utility:
+                    min_val = self.selective_value(child, action, searched, alpha, beta, depth, draft)
+                if min_val is None:
+                    if searched == 1 or alpha == neg_utility or beta - alpha <= null_window:
+                        min_val = child.MIN_VALUE(alpha, beta, depth + 1)[1]
+                    else:
+                        # Principal variation search: a later move is expected to be no
+                        # better than the best so far, which a null window proves cheaply.
+                        # If it turns out better, it is searched again with the full window.
+                        min_val = child.MIN_VALUE(alpha, alpha + null_window, depth + 1)[1]
+                        if alpha < min_val < beta:
+                            if stats is not None:
+                                stats.researches += 1
+                            min_val = child.MIN_VALUE(alpha, beta, depth + 1)[1]
+                board.unmake(action)
+            if best_move is None or v < min_val:
+                v = min_val
+                best_move = action
+            if v >= beta:
+                break
+            alpha = max(alpha, v)
+        if depth > 1:
+            seen.discard(key)
+        if stats is not None:
+            stats.record_children(searched if ordered else 0, v >= beta)
+        if v >= beta:
+            bound = lower_bound
+        elif v <= alpha_orig:
+            bound = upper_bound
+        else:
+            bound = exact_bound
+        if bound != upper_bound:
+            move_history.record_best_move(best_move, depth, draft)
+        transposition_table.store(key, draft, v, bound, best_move.key if best_move is not None else None)
+        if depth == 1:
+            return (best_move, v)
+        return (None, v)
+    
+    def MIN_VALUE(self, alpha, beta, depth):
+        search_control.check_time()
+        stats = search_stats
+        board = self.board
+        key = board.position_key(self.red_turn)
+        seen = search_control.seen
+        quiet_plies = search_control.quiet_plies
+        if depth > 1 and (key in seen or quiet_plies[depth] >= no_progress_limit):
+            return (None, draw_value)
+        if depth == search_control.depth_limit or board.pieces_check_end_game():
+            return (None, self.quiescence(alpha, beta))
+        if tablebase is not None and depth > 1 and board.piece_count() <= tablebase.max_pieces:
+            value = tablebase.probe(board, self.red_turn)
+            if value is not None:
+                if stats is not None:
+                    stats.tablebase_hits += 1
+                return (None, value)
+        draft = search_control.depth_limit - depth
+        entry = transposition_table.probe(key)
+        tt_move = search_control.root_move if depth == 1 else None
+        if entry is not None:
+            tt_move = entry[4]
+            if depth > 1 and entry[1] >= draft:
+                if entry[3] == exact_bound or (entry[3] == lower_bound and entry[2] >= beta) \
+                        or (entry[3] == upper_bound and entry[2] <= alpha):
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return (None, entry[2])
+        beta_orig = beta
+        v = float('inf')
+        best_move = None
+        # The moves are generated and sorted in the buffer of this ply.
+        ordered = search_control.move_buffers[depth]
+        if stats is not None:
+            stats.timed_move_finder(self, ordered)
+            stats.timed_sort_moves(self, ordered, tt_move, depth)
+        else:
+            self.move_finder(ordered)
+            self.sort_moves(ordered, tt_move, depth)
+        child = State(board, not self.red_turn)
+        frontier = None
+        if batch_evaluation and depth + 1 == search_control.depth_limit:
+            frontier = self.frontier_values(ordered, depth)
+        selective = selective_search and depth > 1
+        if depth > 1: # The root position is already in seen
+            seen.add(key)
+        for searched, action in enumerate(ordered, 1):
+            quiet_plies[depth + 1] = 0 if action.irreversible else quiet_plies[depth] + 1
+            if frontier is not None and frontier[searched - 1] is not None:
+                search_control.check_time()
+                max_val = frontier[searched - 1]
+            else:
+                board.make(action)
+                max_val = None
+                if selective and searched > 1 and beta != utility:
+                    max_val = self.selective_value(child, action, searched, alpha, beta, depth, draft)
+                if max_val is None:
+                    if searched == 1 or beta == utility or beta - alpha <= null_window:
+                        max_val = child.MAX_VALUE(alpha, beta, depth + 1)[1]
+                    else:
+                        # Principal variation search, see MAX_VALUE.
+                        max_val = child.MAX_VALUE(beta - null_window, beta, depth + 1)[1]
+                        if alpha < max_val < beta:
+                            if stats is not None:
+                                stats.researches += 1
+                            max_val = child.MAX_VALUE(alpha, beta, depth + 1)[1]
+                board.unmake(action)
+            if best_move is None or v > max_val:
+                v = max_val
+                best_move = action
+            if v <= alpha:
+                break
+            beta = min(beta, v)
+        if depth > 1:
+            seen.discard(key)
+        if stats is not None:
+            stats.record_children(searched if ordered else 0, v <= alpha)
+        if v <= alpha:
+            bound = upper_bound
+        elif v >= beta_orig:
+            bound = lower_bound
+        else:
+            bound = exact_bound
+        if bound != lower_bound:
+            move_history.record_best_move(best_move, depth, draft)
+        transposition_table.store(key, draft, v, bound, best_move.key if best_move is not None else None)
+        if depth == 1:
+            return (best_move, v)
+        return (None, v)
+
+    # def print_board(self):
+    #     for i in range(self.board.height):
+    #         print(self.board.grid[i])
+    #     print('\n')
+
+
+#====================================================================================
+# Parallel search. The root moves are split across a pool of worker processes. In the
+# spirit of Young Brothers Wait, the first (best ordered) root move is searched in the
+# main process to get a bound, and only then are its siblings handed out. Workers share
+# the best root value found so far through shared memory and start each root move with
+# it as their alpha (red) or beta (black). Every worker keeps its own transposition
+# table for the whole game.
+worker_bound = None # Shared best root value, set in each worker process by init_search_worker
+# Module settings copied to the worker processes, which may start from a fresh import
+# of this module rather than a fork of the main process
+worker_setting_names = ('quiescence_search', 'selective_search', 'static_ordering', 'batch_evaluation',
+                        'late_move_count', 'late_move_draft', 'futility_margin', 'futility_draft',
+                        'no_progress_limit', 'draw_value', 'memory_limit_mb', 'memory_reserve_mb',
+                        'memory_processes')
+
+
+def worker_settings():
+    """
+    :return: What a worker process of the parallel search needs to search as this
+        process does: the search settings, the evaluation weights, the sizes of the
+        transposition table and evaluation cache, and the tablebase and book files.
+    :rtype: Dict
+    """
+    return {
+        'settings': dict((name, globals()[name]) for name in worker_setting_names),
+        'weights': get_weights(),
+        'tt_mb': transposition_table.size_mb,
+        'eval_cache_mb': evaluation_cache.size_mb,
+        'tablebase': tablebase.filename if tablebase is not None else None,
+        'book': book.filename if book is not None else None,
+    }
+
+
+def init_search_worker(shared_bound, settings):
+    """
+    Initializes a worker process of the parallel search.
+
+    :param shared_bound: The shared best root value of the search.
+    :type shared_bound: multiprocessing.Value
+    :param settings: The settings of the main process, from worker_settings.
+    :type settings: Dict
+    """
+    global worker_bound, transposition_table, evaluation_cache, tablebase, book
+    worker_bound = shared_bound
+    globals().update(settings['settings'])
+    if settings['weights'] != get_weights():
+        set_weights(settings['weights'])
+    transposition_table = TranspositionTable(settings['tt_mb'])
+    evaluation_cache = EvaluationCache(settings['eval_cache_mb'])
+    fit_memory_limit()
+    tablebase = Tablebase(settings['tablebase']) if settings['tablebase'] is not None else None
+    book = Book(settings['book']) if settings['book'] is not None else None
+
+
+def search_root_move(task):
+    """
+    Searches one root move in a worker process.
+
+    :param task: (board masks, red_turn, index of the move in the root move list,
+        depth limit, wall-clock deadline from time.time() or None, game history of the root)
+    :type task: Tuple
+    :return: (index of the move, its value or None if time ran out, the alpha and
+        beta of the window it was searched with, nodes searched). A value outside
+        the window is only a bound.
+    :rtype: Tuple[int, Optional[float], float, float, int]
+    """
+    (masks, red_turn, move_index, limit, wall_deadline, history) = task
+    board = Board((), *masks)
+    search_control.depth_limit = limit
+    search_control.start_search(State(board, red_turn, 0, history))
+    move = board.generate_moves(red_turn)[0][move_index]
+    search_control.quiet_plies[2] = 0 if move.irreversible else search_control.quiet_plies[1] + 1
+    board.make(move)
+    child = State(board, not red_turn)
+    search_control.deadline = None
+    if wall_deadline is not None:
+        search_control.deadline = time.perf_counter() + wall_deadline - time.time()
+    # The window only has to tell whether the move beats the best value found so far.
+    if red_turn:
+        (alpha, beta) = (worker_bound.value, utility)
+    else:
+        (alpha, beta) = (neg_utility, worker_bound.value)
+    if alpha >= beta:
+        # The best move found so far already wins, which this move can at most
+        # equal, so its value is not searched and only the bound is returned.
+        return (move_index, alpha if red_turn else beta, alpha, beta, 0)
+    nodes_before = search_control.nodes
+    try:
+        if red_turn:
+            value = child.MIN_VALUE(alpha, beta, 2)[1]
+        else:
+            value = child.MAX_VALUE(alpha, beta, 2)[1]
+    except SearchTimeout:
+        return (move_index, None, alpha, beta, search_control.nodes - nodes_before)
+    with worker_bound.get_lock():
+        if (red_turn and value > worker_bound.value) or (not red_turn and value < worker_bound.value):
+            worker_bound.value = value
+    check_memory_limit()
+    return (move_index, value, alpha, beta, search_control.nodes - nodes_before)
+
+
+class ParallelSearch:
+    """
+    A pool of worker processes that search the root moves of a position in parallel.
+    """
+
+    def __init__(self, workers, start_method=None):
+        """
+        :param workers: The number of worker processes.
+        :type workers: int
+        :param start_method: The multiprocessing start method of the workers, or None for the default.
+        :type start_method: Optional[str]
+        """
+        global memory_processes
+        self.workers = workers
+        # The memory limit is shared with the workers, whose tables are as large as
+        # this process's once they have been fitted to its share.
+        memory_processes = workers + 1
+        fit_memory_limit()
+        context = multiprocessing.get_context(start_method)
+        self.bound = context.Value('d', 0.0)
+        self.pool = context.Pool(workers, init_search_worker, (self.bound, worker_settings()))
+
+    def close(self):
+        global memory_processes
+        self.pool.terminate()
+        self.pool.join()
+        memory_processes = 1
+
+    def search(self, state, limit, deadline=None):
+        """
+        Searches the root of a state to a depth limit.
+
+        :param state: The state to search. Its board is used as the working board.
+        :type state: State
+        :param limit: The depth limit of the search.
+        :type limit: int
+        :param deadline: perf_counter deadline of the search, or None.
+        :type deadline: Optional[float]
+        :return: The best move and its value.
+        :rtype: Tuple[Move, float]
+        """
+        board = state.board
+        red_turn = state.red_turn
+        moves = state.move_finder()[0]
+        ordered = state.order_moves(moves, search_control.root_move)
+        wall_deadline = None
+        if deadline is not None:
+            wall_deadline = time.time() + deadline - time.perf_counter()
+
+        # The eldest brother is searched here with a full window.
+        search_control.depth_limit = limit
+        search_control.start_search(state)
+        best_value = self.search_move(state, ordered[0])
+        best_move = ordered[0]
+        self.bound.value = best_value
+
+        masks = (board.red_men, board.red_kings, board.black_men, board.black_kings)
+        order = dict((id(move), rank) for rank, move in enumerate(ordered))
+        tasks = [(masks, red_turn, index, limit, wall_deadline, state.history) for index, move in enumerate(moves)
+                 if move is not ordered[0]]
+        results = self.pool.map(search_root_move, tasks, chunksize=1)
+        # The results are merged in the search order, so that of moves with equal
+        # values the same one is chosen as by the search in a single process.
+        for (index, value, alpha, beta, nodes) in sorted(results, key=lambda result: order[id(moves[result[0]])]):
+            search_control.nodes += nodes
+            if value is None:
+                raise SearchTimeout()
+            if (red_turn and value > best_value) or (not red_turn and value < best_value):
+                if (red_turn and value <= alpha) or (not red_turn and value >= beta):
+                    # The value is only a bound, as the window was narrowed by moves
+                    # later in the search order, so it is searched again with a full
+                    # window before it is compared.
+                    value = self.search_move(state, moves[index])
+                    if (red_turn and value <= best_value) or (not red_turn and value >= best_value):
+                        continue
+                best_value = value
+                best_move = moves[index]
+        return (best_move, best_value)
+
+    def search_move(self, state, move):
+        """
+        Searches one root move in this process with a full window. start_search
+        must have been called for the state.
+
+        :param state: The root state. Its board is used as the working board.
+        :type state: State
+        :param move: The root move.
+        :type move: Move
+        :return: The value of the move.
+        :rtype: float
+        """
+        board = state.board
+        search_control.quiet_plies[2] = 0 if move.irreversible else search_control.quiet_plies[1] + 1
+        child = State(board, not state.red_turn)
+        board.make(move)
+        if state.red_turn:
+            value = child.MIN_VALUE(neg_utility, utility, 2)[1]
+        else:
+            value = child.MAX_VALUE(neg_utility, utility, 2)[1]
+        board.unmake(move)
+        return value
+
+
+parallel_search = None # The ParallelSearch used by alpha_beta_prune, or None to search in this process
+
+
+def measure_parallel_speedup(state, workers):
+    """
+    Times a fixed-depth search of a state's root, once in this process and once
+    with a pool of worker processes, both starting from empty transposition tables,
+    evaluation caches and move histories.
+
+    :param state: The state to search.
+    :type state: State
+    :param workers: The number of worker processes.
+    :type workers: int
+    :return: The serial and parallel times in seconds and the speedup.
+    :rtype: Dict[str, float]
+    """
+    global parallel_search
+    clear_search_tables()
+    start = time.perf_counter()
+    state.iterative_deepening()
+    serial_time = time.perf_counter() - start
+
+    clear_search_tables()
+    parallel_search = ParallelSearch(workers)
+    try:
+        start = time.perf_counter()
+        state.iterative_deepening()
+        parallel_time = time.perf_counter() - start
+    finally:
+        parallel_search.close()
+        parallel_search = None
+    clear_search_tables()
+    return {'workers': workers, 'serial_s': serial_time, 'parallel_s': parallel_time,
+            'speedup': serial_time / parallel_time}
+
+
+#====================================================================================
+# Perft: counts the positions reached by every sequence of legal moves to a fixed depth.
+# Running it with two move generators checks that they agree (the totals and the count
+# below each root move, the "divide", must be identical), and timing it measures raw
+# move generation speed apart from the search. The reference generator works directly
+# on the grid of characters, as the solver originally did, and follows the rules one
+# step at a time: jumping is forced, a jump continues while another capture is
+# possible, and a basic piece that is crowned ends its turn.
+def grid_directions(red_turn, is_king):
+    if is_king:
+        return diagonal_directions
+    if red_turn:
+        return diagonal_directions[:2]
+    return diagonal_directions[2:]
+
+
+def grid_moves(grid, red_turn):
+    """
+    Reference move generator on a grid of characters.
+
+    :param grid: The 8x8 grid of the position.
+    :type grid: List[List[str]]
+    :param red_turn: True if it is the red player's turn.
+    :type red_turn: bool
+    :return: A (path, grid after the move) tuple per move, and True if they are jumps
+    :rtype: Tuple[List[Tuple[List[Tuple[int, int]], List[List[str]]]], bool]
+    """
+    own = valid_red if red_turn else valid_black
+    opponent = valid_black if red_turn else valid_red
+    jumps = []
+    regular = []
+    for y_coord in valid_positions:
+        for x_coord in valid_positions:
+            if grid[y_coord][x_coord] not in own:
+                continue
+            is_king = grid[y_coord][x_coord] in (char_red_king, char_black_king)
+            for (x_change, y_change) in grid_directions(red_turn, is_king):
+                (x_over, y_over) = (x_coord + x_change, y_coord + y_change)
+                (x_land, y_land) = (x_coord + 2 * x_change, y_coord + 2 * y_change)
+                if x_land in valid_positions and y_land in valid_positions and grid[y_over][x_over] in opponent \
+                        and grid[y_land][x_land] == empty_slot:
+                    grid_jumps(grid, red_turn, is_king, x_coord, y_coord, x_change, y_change,
+                               [(x_coord, y_coord)], jumps)
+                elif x_over in valid_positions and y_over in valid_positions and grid[y_over][x_over] == empty_slot:
+                    new_grid = [row[:] for row in grid]
+                    new_grid[y_over][x_over] = grid_crown(grid[y_coord][x_coord], y_over)
+                    new_grid[y_coord][x_coord] = empty_slot
+                    regular.append(([(x_coord, y_coord), (x_over, y_over)], new_grid))
+    if len(jumps) == 0:
+        return (regular, False)
+    return (jumps, True)
+
+
+def grid_crown(char, y_coord):
+    """
+    Returns the character of a piece after it arrives on a row.
+    """
+    if char == char_red_basic and y_coord == 0:
+        return char_red_king
+    if char == char_black_basic and y_coord == 7:
+        return char_black_king
+    return char
+
+
+def grid_jumps(grid, red_turn, is_king, x_coord, y_coord, x_change, y_change, path, jumps):
+    """
+    Makes one hop of a jump on a copy of the grid and continues the jump from the
+    landing square, appending every finished jump sequence to jumps.
+    """
+    opponent = valid_black if red_turn else valid_red
+    new_grid = [row[:] for row in grid]
+    char = new_grid[y_coord][x_coord]
+    new_grid[y_coord][x_coord] = empty_slot
+    new_grid[y_coord + y_change][x_coord + x_change] = empty_slot
+    (x_coord, y_coord) = (x_coord + 2 * x_change, y_coord + 2 * y_change)
+    path = path + [(x_coord, y_coord)]
+    new_grid[y_coord][x_coord] = grid_crown(char, y_coord)
+    if new_grid[y_coord][x_coord] != char:
+        jumps.append((path, new_grid))
+        return
+    count = 0
+    for (x_change, y_change) in grid_directions(red_turn, is_king):
+        (x_land, y_land) = (x_coord + 2 * x_change, y_coord + 2 * y_change)
+        if x_land in valid_positions and y_land in valid_positions \
+                and new_grid[y_coord + y_change][x_coord + x_change] in opponent \
+                and new_grid[y_land][x_land] == empty_slot:
+            grid_jumps(new_grid, red_turn, is_king, x_coord, y_coord, x_change, y_change, path, jumps)
+            count += 1
+    if count == 0:
+        jumps.append((path, new_grid))
+
+
+def move_name(path):
+    """
+    Names a move by the squares it visits, for example '2,5-3,4'.
+    """
+    return '-'.join('{},{}'.format(x_coord, y_coord) for (x_coord, y_coord) in path)
+
+
+def perft(board, red_turn, depth):
+    """
+    Counts the positions reached after depth plies with the bitboard move generator.
+
+    :param board: The position. Moves are made and taken back on it.
+    :type board: Board
+    :param red_turn: True if it is the red player's turn.
+    :type red_turn: bool
+    :param depth: The number of plies.
+    :type depth: int
+    :rtype: int
+    """
+    if depth == 0:
+        return 1
+    moves = board.generate_moves(red_turn)[0]
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make(move)
+        nodes += perft(board, not red_turn, depth - 1)
+        board.unmake(move)
+    return nodes
+
+
+def grid_perft(grid, red_turn, depth):
+    """
+    Counts the positions reached after depth plies with the reference move generator.
+
+    :rtype: int
+    """
+    if depth == 0:
+        return 1
+    moves = grid_moves(grid, red_turn)[0]
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for (path, new_grid) in moves:
+        nodes += grid_perft(new_grid, not red_turn, depth - 1)
+    return nodes
+
+
+def perft_divide(board, red_turn, depth, backend='bitboard'):
+    """
+    Counts the positions reached after depth plies below each root move.
+
+    :param board: The position.
+    :type board: Board
+    :param red_turn: True if it is the red player's turn.
+    :type red_turn: bool
+    :param depth: The number of plies, at least 1.
+    :type depth: int
+    :param backend: 'bitboard' for Board.generate_moves or 'reference' for grid_moves.
+    :type backend: str
+    :return: The count for each root move, by move_name.
+    :rtype: Dict[str, int]
+    """
+    divide = {}
+    if backend == 'reference':
+        for (path, new_grid) in grid_moves(board.grid, red_turn)[0]:
+            name = move_name(path)
+            divide[name] = divide.get(name, 0) + grid_perft(new_grid, not red_turn, depth - 1)
+        return divide
+    board = board.copy()
+    for move in board.generate_moves(red_turn)[0]:
+        name = move_name([square_coords[square] for square in move.path])
+        board.make(move)
+        divide[name] = divide.get(name, 0) + perft(board, not red_turn, depth - 1)
+        board.unmake(move)
+    return divide
+
+
+perft_backends = ('bitboard', 'reference')
+
+
+def run_perft(board, red_turn, depth, backends=perft_backends):
+    """
+    Runs perft with several move generators, times them and checks that their
+    divides agree with the first one.
+
+    :param board: The position.
+    :type board: Board
+    :param red_turn: True if it is the red player's turn.
+    :type red_turn: bool
+    :param depth: The number of plies, at least 1.
+    :type depth: int
+    :param backends: The move generators to run.
+    :type backends: Iterable[str]
+    :return: The divide of the first generator, and per generator the total, the time,
+        the leaf moves generated per second and whether it matches the first one.
+    :rtype: Tuple[Dict[str, int], List[Dict]]
+    """
+    expected = None
+    results = []
+    for backend in backends:
+        start = time.perf_counter()
+        divide = perft_divide(board, red_turn, depth, backend)
+        seconds = time.perf_counter() - start
+        nodes = sum(divide.values())
+        if expected is None:
+            expected = divide
+        results.append({'backend': backend, 'depth': depth, 'nodes': nodes, 'seconds': seconds,
+                        'moves_per_second': nodes / seconds if seconds > 0 else None,
+                        'matches': divide == expected})
+    return (expected, results)
+
+
+# The standard starting position, in the format of read_from_input.
+opening_grid = ['.b.b.b.b',
+                'b.b.b.b.',
+                '.b.b.b.b',
+                '........',
+                '........',
+                'r.r.r.r.',
+                '.r.r.r.r',
+                'r.r.r.r.']
+
+
+def read_from_file(filename):
+    """
+    Load initial board from a given file.
+
+    :param filename: The name of the given file.
+    :type filename: str
+    :return: A loaded board
+    :rtype: Board
+    """
+
+    puzzle_file = open(filename, "r")
+    board = read_from_input(puzzle_file)
+    puzzle_file.close()
+
+    return board
+
+def read_from_input(board_grid):
+    """
+    Load initial board from a grid of characters, one row per line.
+
+    :param board_grid: The rows of the board (strings or lists of characters).
+    :type board_grid: Iterable
+    :return: A loaded board
+    :rtype: Board
+    """
+
+    board = Board()
+
+    for line_index, line in enumerate(board_grid):
+
+        for x, ch in enumerate(line):
+
+            if ch == char_red_king:
+                board.add_piece(True, True, x, line_index)
+            elif ch == char_red_basic:
+                board.add_piece(True, False, x, line_index)
+            elif ch == char_black_king:
+                board.add_piece(False, True, x, line_index)
+            elif ch == char_black_basic:
+                board.add_piece(False, False, x, line_index)
+
+    return board
+
+
+
+def write_board(output_file, board):
+    """
+    Writes a board to a file as its rows of characters followed by a blank line.
+
+    :param output_file: The open file.
+    :type output_file: file
+    :param board: The board to write.
+    :type board: Board
+    """
+    output_file.write(''.join(''.join(row) + "\n" for row in board.grid) + "\n")
+
+
+def checkers_solve(state, output_filename):
+    """
+    Plays the game from a state to the end. Every state is written to the output
+    as soon as it is played, so the output can be followed while the game runs,
+    and only the current state is kept in memory.
+
+    :param state: The starting state.
+    :type state: State
+    :param output_filename: The file that receives the sequence of states, or '-' for stdout.
+    :type output_filename: str
+    :return: The last state of the game. Its plies attribute counts the moves played.
+    :rtype: State
+    """
+    global parallel_search, stalemate
+    stalemate = False
+    # Search results are reused from move to move within a game, but not between games.
+    clear_search_tables()
+    output_file = sys.stdout if output_filename == '-' else open(output_filename, "w")
+    if parallel_workers > 1:
+        parallel_search = ParallelSearch(parallel_workers)
+    try:
+        write_board(output_file, state.board)
+        output_file.flush()
+        game_start = time.perf_counter()
+        while not state.board.pieces_check_end_game() and not stalemate and not state.is_draw():
+            game_elapsed_ms = (time.perf_counter() - game_start) * 1000
+            next_state = state.alpha_beta_prune(move_time_budget(game_elapsed_ms))
+            if next_state is state: # The side to move has no legal move
+                break
+            state = next_state
+            write_board(output_file, state.board)
+            output_file.flush()
+    finally:
+        if parallel_search is not None:
+            parallel_search.close()
+            parallel_search = None
+        if output_file is not sys.stdout:
+            output_file.close()
+    return state
+
+
+def game_result(state):
+    """
+    Describes how a finished game ended.
+
+    :param state: The last state of the game.
+    :type state: State
+    :return: 'red' or 'black' for the winner, 'draw', or 'unfinished'.
+    :rtype: str
+    """
+    if not state.board.black_pieces_on_board():
+        return 'red'
+    if not state.board.red_pieces_on_board():
+        return 'black'
+    if len(state.move_finder()[0]) == 0:
+        return 'black' if state.red_turn else 'red'
+    if state.is_draw():
+        return 'draw'
+    return 'unfinished'
+
+
+def puzzle_files(input_dir=None, input_glob=None, manifest=None):
+    """
+    Lists the puzzle files of a batch, sorted by name for directories and globs.
+
+    :param input_dir: A directory whose files are all puzzles.
+    :type input_dir: Optional[str]
+    :param input_glob: A glob pattern matching the puzzle files.
+    :type input_glob: Optional[str]
+    :param manifest: A file naming one puzzle file per line.
+    :type manifest: Optional[str]
+    :return: The paths of the puzzle files.
+    :rtype: List[str]
+    """
+    if input_dir is not None:
+        return sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir)
+                      if os.path.isfile(os.path.join(input_dir, name)))
+    if input_glob is not None:
+        return sorted(path for path in glob.glob(input_glob) if os.path.isfile(path))
+    manifest_file = open(manifest, "r")
+    paths = [line.strip() for line in manifest_file if line.strip() and not line.startswith('#')]
+    manifest_file.close()
+    return paths
+
+
+def output_paths(input_paths, output_dir):
+    """
+    Names the solution of each puzzle of a batch. The path of each puzzle file
+    relative to the directory that holds all of them is mirrored under the output
+    directory, so that puzzle files of the same name in different directories do
+    not overwrite each other's solutions.
+
+    :param input_paths: The puzzle files.
+    :type input_paths: List[str]
+    :param output_dir: The directory for the solutions.
+    :type output_dir: str
+    :return: The solution file of each puzzle file.
+    :rtype: List[str]
+    """
+    if not input_paths:
+        return []
+    directories = [os.path.dirname(os.path.abspath(path)) for path in input_paths]
+    common_dir = os.path.commonpath(directories)
+    outputs = []
+    seen = {}
+    for path in input_paths:
+        output_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), common_dir))
+        if output_path in seen:
+            raise ValueError('puzzle files {} and {} would both write {}'.format(seen[output_path], path, output_path))
+        seen[output_path] = path
+        outputs.append(output_path)
+    return outputs
+
+
+def solve_puzzle(paths):
+    """
+    Solves one puzzle of a batch and writes its solution. Errors are reported in
+    the summary instead of stopping the batch.
+
+    :param paths: The input file and the output file of the puzzle.
+    :type paths: Tuple[str, str]
+    :return: The summary of the puzzle: time, nodes, plies and result.
+    :rtype: Dict
+    """
+    (input_path, output_path) = paths
+    summary = {'input': input_path, 'output': output_path}
+    start = time.perf_counter()
+    nodes_before = search_control.nodes
+    try:
+        state = checkers_solve(State(read_from_file(input_path)), output_path)
+    except Exception as error:
+        summary['error'] = '{}: {}'.format(type(error).__name__, error)
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+    summary['seconds'] = time.perf_counter() - start
+    summary['nodes'] = search_control.nodes - nodes_before
+    summary['result'] = game_result(state)
+    summary['plies'] = state.plies
+    return summary
+
+
+def solve_batch(input_paths, output_dir, summary_filename, workers=1):
+    """
+    Solves many puzzles with a pool of worker processes that stay alive for the
+    whole batch. Each solution is written as soon as its puzzle is solved, and a
+    summary line is appended for it in the order puzzles finish.
+
+    :param input_paths: The puzzle files.
+    :type input_paths: List[str]
+    :param output_dir: The directory for the solutions, laid out as the puzzle files are (see output_paths).
+    :type output_dir: str
+    :param summary_filename: The JSON lines file that receives one summary per puzzle.
+    :type summary_filename: str
+    :param workers: The number of worker processes.
+    :type workers: int
+    :return: The number of puzzles, the total time and the throughput.
+    :rtype: Dict
+    """
+    tasks = list(zip(input_paths, output_paths(input_paths, output_dir)))
+    os.makedirs(output_dir, exist_ok=True)
+    for directory in set(os.path.dirname(output_path) for (input_path, output_path) in tasks):
+        os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    summary_file = open(summary_filename, "w")
+    try:
+        if pool is not None:
+            summaries = pool.imap_unordered(solve_puzzle, tasks)
+        else:
+            summaries = map(solve_puzzle, tasks)
+        for summary in summaries:
+            summary_file.write(json.dumps(summary) + "\n")
+            summary_file.flush()
+    finally:
+        summary_file.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    seconds = time.perf_counter() - start
+    return {'puzzles': len(tasks), 'seconds': seconds,
+            'puzzles_per_second': len(tasks) / seconds if seconds > 0 else None}
 
-def checkers_solve(state, output_filename):
-    while not state.board.pieces_check_end_game() and not stalemate:
-        state = state.alpha_beta_prune()
-    state.output(state, output_filename)
-    return
 
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
         "--inputfile",
         type=str,
-        required=True,
         help="The input file that contains the puzzle."
     )
+    inputs.add_argument(
+        "--inputdir",
+        type=str,
+        help="Batch mode: solve every puzzle file in this directory."
+    )
+    inputs.add_argument(
+        "--inputglob",
+        type=str,
+        help="Batch mode: solve every puzzle file matching this glob pattern."
+    )
+    inputs.add_argument(
+        "--manifest",
+        type=str,
+        help="Batch mode: solve the puzzle files listed in this file, one per line."
+    )
     parser.add_argument(
         "--outputfile",
         type=str,
-        required=True,
-        help="The output file that contains the solution."
+        help="The output file that receives every state of the solution as it is played, or - for stdout."
+    )
+    parser.add_argument(
+        "--outputdir",
+        type=str,
+        help="Batch mode: the directory that receives one solution per puzzle."
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default=None,
+        help="Batch mode: JSON lines file with the time, nodes and result of each puzzle "
+             "(default: summary.jsonl in the output directory)."
+    )
+    parser.add_argument(
+        "--tt-mb",
+        type=float,
+        default=tt_size_mb,
+        help="Memory cap of the transposition table in megabytes (0 disables it)."
+    )
+    parser.add_argument(
+        "--eval-cache-mb",
+        type=float,
+        default=eval_cache_mb,
+        help="Memory cap of the cache of leaf evaluations in megabytes (0 disables it)."
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=None,
+        help="Resident memory in megabytes to stay within, shared equally with any --workers processes. "
+             "The transposition tables and evaluation caches are made smaller to fit, and halved if a "
+             "process still grows beyond its share. Needs /proc to measure memory."
+    )
+    parser.add_argument(
+        "--movetime-ms",
+        type=float,
+        default=None,
+        help="Time budget per move in milliseconds. The search deepens until it runs out."
+    )
+    parser.add_argument(
+        "--movenodes",
+        type=int,
+        default=None,
+        help="Node budget per move. The search deepens until it runs out."
+    )
+    parser.add_argument(
+        "--gametime-ms",
+        type=float,
+        default=None,
+        help="Time budget for the whole game in milliseconds."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that search the root moves of each position in parallel. "
+             "In batch mode, the number of processes that solve puzzles side by side."
+    )
+    parser.add_argument(
+        "--speedup",
+        action="store_true",
+        help="Before solving, time a fixed-depth search of the first position with and "
+             "without the --workers processes and print the speedup."
+    )
+    parser.add_argument(
+        "--tablebase",
+        type=str,
+        default=None,
+        help="Endgame tablebase file written by tablebase.py, probed once few pieces are left."
+    )
+    parser.add_argument(
+        "--book",
+        type=str,
+        default=None,
+        help="Position book file written by book.py, consulted before searching each move."
+    )
+    parser.add_argument(
+        "--stats",
+        type=str,
+        default=None,
+        help="Write search statistics (nodes, cutoffs, branching factor, timings) as one "
+             "JSON line per move to this file, or to stderr for '-'."
+    )
+    parser.add_argument(
+        "--batch-eval",
+        action="store_true",
+        help="Evaluate all the children of a node one ply above the depth limit in one batch "
+             "(with NumPy if it is installed)."
+    )
+    parser.add_argument(
+        "--no-quiescence",
+        action="store_true",
+        help="Evaluate positions at the depth limit even when the side to move has a jump pending."
+    )
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Search every move to the full depth, without late move reductions or futility "
+             "pruning, e.g. to verify puzzle solutions."
+    )
+    parser.add_argument(
+        "--late-moves",
+        type=int,
+        default=late_move_count,
+        help="Moves of a node searched to the full depth before later quiet moves are reduced by a ply."
+    )
+    parser.add_argument(
+        "--futility-margin",
+        type=float,
+        default=futility_margin,
+        help="Points a quiet move near the leaves may gain over its evaluation before it is "
+             "pruned (negative to not prune)."
+    )
+    parser.add_argument(
+        "--static-ordering",
+        action="store_true",
+        help="Order the moves of every node by the evaluation of their children instead of "
+             "by killer moves and the history heuristic."
+    )
+    parser.add_argument(
+        "--no-progress-plies",
+        type=int,
+        default=no_progress_limit,
+        help="Draw the game after this many plies without a capture or a move of a basic piece."
+    )
+    parser.add_argument(
+        "--perft",
+        type=int,
+        default=None,
+        metavar="DEPTH",
+        help="Instead of solving, count the positions reached after DEPTH plies from the input "
+             "position with every move generator, print the count below each root move, and "
+             "report the speed of each generator and whether they agree."
     )
     args = parser.parse_args()
+    batch_mode = args.inputfile is None
+    if batch_mode and args.outputdir is None:
+        parser.error("batch mode requires --outputdir")
+    if args.perft is not None and (batch_mode or args.perft < 1):
+        parser.error("--perft requires --inputfile and a depth of at least 1")
+    if not batch_mode and args.outputfile is None and args.perft is None:
+        parser.error("--inputfile requires --outputfile")
+
+    move_time_ms = args.movetime_ms
+    move_node_limit = args.movenodes
+    game_time_ms = args.gametime_ms
+    parallel_workers = args.workers
+    static_ordering = args.static_ordering
+    quiescence_search = not args.no_quiescence
+    selective_search = not args.exact
+    late_move_count = args.late_moves
+    futility_margin = args.futility_margin if args.futility_margin >= 0 else None
+    batch_evaluation = args.batch_eval
+    no_progress_limit = args.no_progress_plies
+
+    transposition_table = TranspositionTable(args.tt_mb)
+    evaluation_cache = EvaluationCache(args.eval_cache_mb)
+    memory_limit_mb = args.memory_mb
+    fit_memory_limit()
+    if args.tablebase is not None:
+        tablebase = Tablebase(args.tablebase)
+    if args.book is not None:
+        book = Book(args.book)
+    if args.stats is not None:
+        search_stats = SearchStats(sys.stderr if args.stats == '-' else open(args.stats, "w"))
+
+    if batch_mode:
+        # Puzzles are solved side by side, each with a single-process search.
+        parallel_workers = 1
+        summary_filename = args.summary or os.path.join(args.outputdir, "summary.jsonl")
+        paths = puzzle_files(args.inputdir, args.inputglob, args.manifest)
+        try:
+            print(json.dumps(solve_batch(paths, args.outputdir, summary_filename, args.workers)), file=sys.stderr)
+        except ValueError as error:
+            parser.error(str(error))
+        sys.exit(0)
 
     board = read_from_file(args.inputfile)
     starting_state = State(board)
 
+    if args.perft is not None:
+        (divide, results) = run_perft(board, starting_state.red_turn, args.perft)
+        for name in sorted(divide):
+            print('{} {}'.format(name, divide[name]))
+        print('total {}'.format(sum(divide.values())))
+        for result in results:
+            print(json.dumps(result), file=sys.stderr)
+        sys.exit(0 if all(result['matches'] for result in results) else 1)
+
+    if args.speedup and parallel_workers > 1 and len(starting_state.move_finder()[0]) > 1:
+        print(json.dumps(measure_parallel_speedup(starting_state, parallel_workers)), file=sys.stderr)
     
     checkers_solve(starting_state, args.outputfile)
 
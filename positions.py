@@ -0,0 +1,91 @@
+"""
+Converts position corpora between text grids and packed position files.
+
+A packed position file stores each position in 17 bytes: the four piece masks of
+a Board and the side to move (see checkers.PositionWriter). Reading one back
+needs no parsing, and checkers.PositionFile opens it memory-mapped for random
+access. Text corpora hold boards in the read_from_input format, each optionally
+followed by a line "red" or "black" naming the side to move, separated by blank
+lines (see checkers.read_grid_positions); puzzle files are corpora of one
+position. The conversion is lossless in both directions.
+"""
+
+import argparse
+import sys
+
+import checkers
+
+
+def pack(text_files, filename):
+    """
+    Packs the positions of text corpora, in order, into one packed position file.
+
+    :param text_files: The text corpora, or - for stdin.
+    :type text_files: List[str]
+    :param filename: The packed position file to write.
+    :type filename: str
+    :return: The number of positions written.
+    :rtype: int
+    """
+    with checkers.PositionWriter(filename) as writer:
+        for text_file in text_files:
+            lines = sys.stdin if text_file == "-" else open(text_file, "r")
+            try:
+                for position in checkers.read_grid_positions(lines):
+                    writer.write(position)
+            except ValueError as error:
+                raise ValueError('{}: {}'.format(text_file, error))
+            finally:
+                if lines is not sys.stdin:
+                    lines.close()
+        return writer.count
+
+
+def unpack(filename, text_file):
+    """
+    Writes the positions of a packed position file as a text corpus.
+
+    :param filename: The packed position file.
+    :type filename: str
+    :param text_file: The text corpus to write, or - for stdout.
+    :type text_file: str
+    :return: The number of positions written.
+    :rtype: int
+    """
+    output_file = sys.stdout if text_file == "-" else open(text_file, "w")
+    count = 0
+    try:
+        for position in checkers.read_positions(filename):
+            checkers.write_grid_positions(output_file, [position])
+            count += 1
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    return count
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Convert checkers positions between text grids and packed files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="Pack text corpora or puzzle files into one packed file.")
+    pack_parser.add_argument("inputs", type=str, nargs="+", help="Text corpora or puzzle files, or - for stdin.")
+    pack_parser.add_argument("--output", type=str, required=True, help="The packed position file to write.")
+    unpack_parser = commands.add_parser("unpack", help="Write a packed file as a text corpus.")
+    unpack_parser.add_argument("input", type=str, help="The packed position file.")
+    unpack_parser.add_argument("--output", type=str, default="-", help="The text corpus to write, or - for stdout.")
+    count_parser = commands.add_parser("count", help="Print the number of positions in a packed file.")
+    count_parser.add_argument("input", type=str, help="The packed position file.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "pack":
+            print(pack(args.inputs, args.output), file=sys.stderr)
+        elif args.command == "unpack":
+            print(unpack(args.input, args.output), file=sys.stderr)
+        else:
+            position_file = checkers.PositionFile(args.input)
+            print(len(position_file))
+            position_file.close()
+    except ValueError as error:
+        parser.exit(1, "positions.py: error: {}\n".format(error))
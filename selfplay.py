@@ -0,0 +1,253 @@
+"""
+Self-play match runner for tuning the evaluation of the checkers solver.
+
+Plays many short games between two sets of evaluation weights (see
+checkers.set_weights) across worker processes. Each game starts from the
+standard opening followed by a number of random plies, so that the games of a
+match differ, and the two sets take turns playing red. Moves are found with a
+short fixed-depth or fixed-node search, each side keeping its own
+transposition table, evaluation cache and move ordering history. One CSV row is
+written per game as it finishes, and the match result and throughput are
+printed at the end.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import checkers
+
+
+result_columns = ['game', 'seed', 'red', 'result', 'winner', 'plies', 'seconds', 'nodes']
+
+# Settings of the games played by this process, see init_match_worker.
+match = None
+
+
+def parse_weights(text):
+    """
+    Reads a weight set given as JSON or as name=value pairs separated by commas,
+    e.g. "king=1.6,centre=0.2". Weights left out keep their default value.
+
+    :param text: The weight set.
+    :type text: str
+    :rtype: Dict[str, float]
+    """
+    text = text.strip()
+    if not text:
+        return {}
+    if text.startswith('{'):
+        weights = {name: float(value) for (name, value) in json.loads(text).items()}
+    else:
+        weights = {}
+        for pair in text.split(','):
+            (name, separator, value) = pair.partition('=')
+            if not separator:
+                raise ValueError('expected name=value, got {!r}'.format(pair))
+            weights[name.strip()] = float(value)
+    for name in weights:
+        if name not in checkers.evaluation_weights:
+            raise ValueError('unknown weight {!r}, expected one of {}'.format(
+                name, ', '.join(checkers.evaluation_weights)))
+    return weights
+
+
+def random_start(rng, plies):
+    """
+    Plays random moves from the standard opening.
+
+    :param rng: The random number generator of the game.
+    :type rng: random.Random
+    :param plies: The number of random plies.
+    :type plies: int
+    :return: The starting state, which may already be finished for large plies.
+    :rtype: State
+    """
+    state = checkers.State(checkers.read_from_input(checkers.opening_grid))
+    for ply in range(plies):
+        moves = state.move_finder()[0]
+        if not moves:
+            break
+        state = state.play(rng.choice(moves))
+    return state
+
+
+def init_match_worker(weight_sets, depth, node_limit, tt_mb, random_plies, max_plies, seed):
+    """
+    Sets up a process to play games: the search limits and one transposition
+    table, evaluation cache and move history per weight set.
+    """
+    global match
+    checkers.depth_limit = depth
+    checkers.move_node_limit = node_limit
+    match = {
+        'weights': [dict(checkers.default_weights, **weights) for weights in weight_sets],
+        'tables': [checkers.TranspositionTable(tt_mb) for weights in weight_sets],
+        'caches': [checkers.EvaluationCache(checkers.eval_cache_mb) for weights in weight_sets],
+        'histories': [checkers.MoveHistory() for weights in weight_sets],
+        'random_plies': random_plies,
+        'max_plies': max_plies,
+        'seed': seed,
+    }
+
+
+def use_side(side):
+    """
+    Switches the evaluation, transposition table, evaluation cache and move
+    history to those of a weight set.
+    """
+    if checkers.get_weights() != match['weights'][side]:
+        checkers.set_weights(match['weights'][side])
+    checkers.transposition_table = match['tables'][side]
+    checkers.evaluation_cache = match['caches'][side]
+    checkers.move_history = match['histories'][side]
+
+
+def play_game(game):
+    """
+    Plays one game of the match. Set 0 plays red in even games and set 1 in odd
+    games, and both games of a pair start from the same position.
+
+    :param game: The number of the game in the match.
+    :type game: int
+    :return: The result row of the game (see result_columns).
+    :rtype: Dict
+    """
+    seed = match['seed'] * 1000003 + game // 2
+    red_side = game % 2
+    start = time.perf_counter()
+    state = random_start(random.Random(seed), match['random_plies'])
+    for table in match['tables'] + match['caches']:
+        table.clear()
+    for history in match['histories']:
+        history.clear()
+    nodes_before = checkers.search_control.nodes
+    while state.plies < match['max_plies']:
+        if state.board.pieces_check_end_game() or state.is_draw():
+            break
+        use_side(red_side if state.red_turn else 1 - red_side)
+        move = state.choose_move()
+        if move is None:
+            break
+        state = state.play(move)
+    result = checkers.game_result(state)
+    if result in ('red', 'black'):
+        winner = 'AB'[red_side if result == 'red' else 1 - red_side]
+    else:
+        winner = '-'
+    return {'game': game, 'seed': seed, 'red': 'AB'[red_side], 'result': result, 'winner': winner,
+            'plies': state.plies, 'seconds': round(time.perf_counter() - start, 3),
+            'nodes': checkers.search_control.nodes - nodes_before}
+
+
+def run_match(weight_sets, games, depth, node_limit=None, tt_mb=16, random_plies=6, max_plies=200,
+              seed=0, workers=1, output=None):
+    """
+    Plays a match between two weight sets.
+
+    :param weight_sets: Weights of set A and set B, in points.
+    :type weight_sets: List[Dict[str, float]]
+    :param games: The number of games.
+    :type games: int
+    :param depth: The depth limit of each search (see checkers.depth_limit).
+    :type depth: int
+    :param node_limit: The node budget of each move, or None to search to the depth limit.
+    :type node_limit: Optional[int]
+    :param tt_mb: Memory cap of each transposition table in megabytes.
+    :type tt_mb: float
+    :param random_plies: The number of random plies played from the opening.
+    :type random_plies: int
+    :param max_plies: Games still going after this many plies are left unfinished.
+    :type max_plies: int
+    :param seed: Seed of the starting positions.
+    :type seed: int
+    :param workers: The number of processes playing games side by side.
+    :type workers: int
+    :param output: Receives one CSV row per game, or None.
+    :type output: Optional[IO[str]]
+    :return: The match summary: games won by each set, draws, unfinished games, the score of set A and
+        games per hour. The score counts a win as 1 and a draw as 1/2 over the finished games only, and is
+        None if no game finished.
+    :rtype: Dict
+    """
+    settings = (weight_sets, depth, node_limit, tt_mb, random_plies, max_plies, seed)
+    writer = None
+    if output is not None:
+        writer = csv.DictWriter(output, result_columns)
+        writer.writeheader()
+    counts = {'A': 0, 'B': 0, '-': 0}
+    unfinished = 0
+    plies = 0
+    nodes = 0
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(workers, init_match_worker, settings) if workers > 1 else None
+    try:
+        if pool is not None:
+            rows = pool.imap_unordered(play_game, range(games), chunksize=2)
+        else:
+            init_match_worker(*settings)
+            rows = map(play_game, range(games))
+        for row in rows:
+            if writer is not None:
+                writer.writerow(row)
+                output.flush()
+            counts[row['winner']] += 1
+            unfinished += row['result'] == 'unfinished'
+            plies += row['plies']
+            nodes += row['nodes']
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    seconds = time.perf_counter() - start
+    draws = counts['-'] - unfinished
+    finished = games - unfinished
+    return {'games': games, 'a_wins': counts['A'], 'b_wins': counts['B'], 'draws': draws,
+            'unfinished': unfinished, 'a_score': (counts['A'] + draws / 2) / finished if finished else None,
+            'seconds': round(seconds, 3), 'games_per_hour': round(games * 3600 / seconds, 1) if seconds > 0 else None,
+            'plies': plies, 'nodes': nodes, 'nodes_per_second': round(nodes / seconds) if seconds > 0 else None}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Play a self-play match between two evaluation weight sets.")
+    parser.add_argument("--a", type=str, default="",
+                        help="Weights of set A as name=value pairs or JSON, e.g. king=1.6,centre=0.2 "
+                             "(names: {}). Weights left out keep their default.".format(
+                                 ', '.join(checkers.evaluation_weights)))
+    parser.add_argument("--b", type=str, default="",
+                        help="Weights of set B, as for --a.")
+    parser.add_argument("--games", type=int, default=100,
+                        help="Number of games. Pairs of games share a start with the colours swapped.")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="Depth limit of each search.")
+    parser.add_argument("--nodes", type=int, default=None,
+                        help="Node budget per move instead of a fixed depth. The search deepens until it runs out.")
+    parser.add_argument("--random-plies", type=int, default=6,
+                        help="Random plies played from the opening to make the starting position.")
+    parser.add_argument("--max-plies", type=int, default=200,
+                        help="Games still going after this many plies are left unfinished.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the starting positions.")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of processes playing games side by side.")
+    parser.add_argument("--tt-mb", type=float, default=16,
+                        help="Memory cap of each transposition table in megabytes (two per process).")
+    parser.add_argument("--output", type=str, default="-",
+                        help="CSV file that receives one row per game, or - for stdout.")
+    args = parser.parse_args()
+
+    try:
+        weight_sets = [parse_weights(args.a), parse_weights(args.b)]
+    except ValueError as error:
+        parser.error(str(error))
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    summary = run_match(weight_sets, args.games, args.depth, args.nodes, args.tt_mb, args.random_plies,
+                        args.max_plies, args.seed, args.workers, output)
+    if output is not sys.stdout:
+        output.close()
+    print(json.dumps(summary, sort_keys=True), file=sys.stderr)
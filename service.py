@@ -0,0 +1,316 @@
+"""
+Long-running checkers solver service.
+
+The solver is loaded once and answers requests over a Unix socket or a localhost
+TCP port, so the move tables, the transposition table, the move ordering history
+and any tablebase or position book stay warm from one request to the next.
+
+Protocol: one JSON object per line in each direction. A request is
+    {"grid": [8 rows in the read_from_input format], "red_turn": true,
+     "mode": "move" or "line", "depth": 8, "deadline_ms": 500, "id": anything}
+where only "grid" is required. "move" returns the best move and the board after
+it, or a null move and the result when the game is already over, and "line"
+plays the game out and returns every move. With "deadline_ms" the
+search deepens until the deadline, which counts from the moment the request was
+received, including any time spent waiting for the solver. {"command": "stats"}
+returns the service counters. Errors are returned as {"error": message}.
+
+Searches run one at a time on a single solver thread. At most max_pending
+requests may be waiting or running; further requests are refused with a "busy"
+error straight away so that callers can back off.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import checkers
+
+
+max_line_plies = 500 # Longest line played for a "line" request
+
+
+def grid_rows(board):
+    """
+    :return: The rows of a board as strings in the read_from_input format.
+    :rtype: List[str]
+    """
+    return [''.join(row) for row in board.grid]
+
+
+def move_path(move):
+    return [list(checkers.square_coords[square]) for square in move.path]
+
+
+class SolverService:
+    """
+    Answers solver requests, caching the answers of fixed-depth requests.
+    """
+
+    def __init__(self, max_pending=16, cache_size=4096, depth=checkers.depth_limit):
+        """
+        :param max_pending: The number of requests that may be waiting or running at once.
+        :type max_pending: int
+        :param cache_size: The number of fixed-depth answers kept (0 disables the cache).
+        :type cache_size: int
+        :param depth: The depth limit of requests that do not give one.
+        :type depth: int
+        """
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.depth = depth
+        self.pending = asyncio.Semaphore(max_pending)
+        # The search uses module-level state, so only one search may run at a time.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cache = OrderedDict()
+        self.counters = {'requests': 0, 'solved': 0, 'busy': 0, 'expired': 0, 'errors': 0, 'cache_hits': 0}
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['cached_answers'] = len(self.cache)
+        stats['tt_mb'] = checkers.transposition_table.size_mb
+        stats['eval_cache_hit_rate'] = checkers.evaluation_cache.hit_rate()
+        stats['rss_kb'] = checkers.current_rss_kb()
+        stats['peak_rss_kb'] = checkers.peak_rss_kb()
+        return stats
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the requests of one connection in order until the client closes it.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = time.perf_counter()
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('a request must be a JSON object')
+                except ValueError as error:
+                    request = {}
+                    response = {'error': 'invalid request: {}'.format(error)}
+                    self.counters['errors'] += 1
+                else:
+                    response = await self.handle_request(request, received)
+                if 'id' in request:
+                    response['id'] = request['id']
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request, received):
+        """
+        :param request: The decoded request.
+        :type request: Dict
+        :param received: perf_counter time at which the request was read.
+        :type received: float
+        :rtype: Dict
+        """
+        if request.get('command') == 'stats':
+            return self.stats()
+        self.counters['requests'] += 1
+        if self.pending.locked():
+            self.counters['busy'] += 1
+            return {'error': 'busy'}
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.solve, request, received)
+
+    def solve(self, request, received):
+        """
+        Answers one request on the solver thread. A request that fails in the
+        solver is answered with an error instead of dropping the connection.
+
+        :rtype: Dict
+        """
+        try:
+            return self.answer(request, received)
+        except Exception as error:
+            self.counters['errors'] += 1
+            return {'error': 'internal error: {}: {}'.format(type(error).__name__, error)}
+
+    def answer(self, request, received):
+        """
+        :rtype: Dict
+        """
+        try:
+            red_turn = request.get('red_turn', True)
+            if not isinstance(red_turn, bool):
+                raise ValueError('red_turn must be true or false')
+            mode = request.get('mode', 'move')
+            if mode not in ('move', 'line'):
+                raise ValueError('unknown mode {!r}'.format(mode))
+            depth = int(request.get('depth', self.depth))
+            if depth < 2:
+                raise ValueError('depth must be at least 2')
+            deadline_ms = request.get('deadline_ms')
+            if deadline_ms is not None:
+                deadline_ms = float(deadline_ms)
+            grid = request['grid']
+            if len(grid) != 8 or any(len(row) != 8 for row in grid):
+                raise ValueError('the grid must have 8 rows of 8 squares')
+            board = checkers.read_from_input(grid)
+        except (KeyError, TypeError, ValueError) as error:
+            self.counters['errors'] += 1
+            return {'error': 'invalid request: {}'.format(error)}
+
+        deadline = None
+        if deadline_ms is not None:
+            deadline = received + deadline_ms / 1000
+            if time.perf_counter() >= deadline:
+                self.counters['expired'] += 1
+                return {'error': 'deadline expired before the search started'}
+
+        # Fixed-depth answers only depend on the position, so they can be reused.
+        cache_key = None
+        if deadline is None and self.cache_size > 0:
+            cache_key = (board.position_key(red_turn), mode, depth)
+            if cache_key in self.cache:
+                self.cache.move_to_end(cache_key)
+                self.counters['cache_hits'] += 1
+                return dict(self.cache[cache_key])
+
+        checkers.depth_limit = depth
+        state = checkers.State(board, red_turn)
+        if mode == 'move':
+            move = state.choose_move(self.time_left_ms(deadline))
+            if move is None:
+                response = {'move': None, 'result': checkers.game_result(state)}
+            else:
+                board.make(move)
+                response = {'move': move_path(move), 'grid': grid_rows(board)}
+        else:
+            response = self.play_line(state, deadline)
+        self.counters['solved'] += 1
+
+        if cache_key is not None:
+            self.cache[cache_key] = response
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return dict(response)
+
+    def time_left_ms(self, deadline, share=1):
+        """
+        :return: The given share of the time left before the deadline in milliseconds, or None.
+        :rtype: Optional[float]
+        """
+        if deadline is None:
+            return None
+        return max(1, (deadline - time.perf_counter()) * 1000 / share)
+
+    def play_line(self, state, deadline):
+        """
+        Plays the game out from a state. Under a deadline each move gets a share of
+        the time left, as in checkers_solve with a game time budget.
+
+        :rtype: Dict
+        """
+        line = []
+        for ply in range(max_line_plies):
+            if state.board.pieces_check_end_game() or state.is_draw():
+                break
+            move = state.choose_move(self.time_left_ms(deadline, checkers.game_time_share))
+            if move is None:
+                break
+            state = state.play(move)
+            line.append({'move': move_path(move), 'grid': grid_rows(state.board)})
+        return {'line': line, 'result': checkers.game_result(state)}
+
+
+async def serve(service, socket_path=None, host='127.0.0.1', port=None):
+    """
+    Runs the service until it is cancelled.
+
+    :param service: The service answering the requests.
+    :type service: SolverService
+    :param socket_path: The Unix socket to listen on, or None to listen on a TCP port.
+    :type socket_path: Optional[str]
+    :param host: The address of the TCP port.
+    :type host: str
+    :param port: The TCP port.
+    :type port: Optional[int]
+    """
+    if socket_path is not None:
+        server = await asyncio.start_unix_server(service.handle_connection, path=socket_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def send_request(request, socket_path=None, host='127.0.0.1', port=None, timeout=None):
+    """
+    Sends one request to a running service and waits for the answer.
+
+    :param request: The request.
+    :type request: Dict
+    :return: The response.
+    :rtype: Dict
+    """
+    if socket_path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = socket_path
+    else:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, port)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(address)
+        connection.sendall((json.dumps(request) + "\n").encode())
+        reply = connection.makefile("rb").readline()
+    finally:
+        connection.close()
+    return json.loads(reply)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve checkers solver requests.")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", type=str, help="Unix socket to listen on.")
+    address.add_argument("--port", type=int, help="Localhost TCP port to listen on.")
+    parser.add_argument("--host", type=str, default='127.0.0.1', help="Address of the TCP port.")
+    parser.add_argument("--depth", type=int, default=checkers.depth_limit,
+                        help="Depth limit of requests that do not give one.")
+    parser.add_argument("--max-pending", type=int, default=16,
+                        help="Requests that may be waiting or running before new ones are refused as busy.")
+    parser.add_argument("--cache-size", type=int, default=4096,
+                        help="Number of fixed-depth answers kept (0 disables the cache).")
+    parser.add_argument("--tt-mb", type=float, default=checkers.tt_size_mb,
+                        help="Memory cap of the shared transposition table in megabytes.")
+    parser.add_argument("--eval-cache-mb", type=float, default=checkers.eval_cache_mb,
+                        help="Memory cap of the shared cache of leaf evaluations in megabytes.")
+    parser.add_argument("--memory-mb", type=float, default=None,
+                        help="Resident memory in megabytes to stay within by shrinking the caches.")
+    parser.add_argument("--tablebase", type=str, default=None,
+                        help="Endgame tablebase file written by tablebase.py.")
+    parser.add_argument("--book", type=str, default=None,
+                        help="Position book file written by book.py.")
+    args = parser.parse_args()
+
+    checkers.transposition_table = checkers.TranspositionTable(args.tt_mb)
+    checkers.evaluation_cache = checkers.EvaluationCache(args.eval_cache_mb)
+    checkers.memory_limit_mb = args.memory_mb
+    if args.tablebase is not None:
+        checkers.tablebase = checkers.Tablebase(args.tablebase)
+    if args.book is not None:
+        checkers.book = checkers.Book(args.book)
+    checkers.fit_memory_limit()
+
+    async def main():
+        service = SolverService(args.max_pending, args.cache_size, args.depth)
+        await serve(service, args.socket, args.host, args.port)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
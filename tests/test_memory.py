@@ -0,0 +1,111 @@
+"""
+Tests of the memory limit: the tables are fitted to the share of the limit of
+each process and halved when a process grows beyond it.
+
+Run with python -m pytest tests (or python -m unittest discover tests).
+"""
+
+import os
+import sys
+import unittest
+import warnings
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checkers
+
+
+def table_sizes_mb(task=None):
+    """
+    :return: The memory caps of the transposition table and the evaluation cache of this process.
+    :rtype: Tuple[float, float]
+    """
+    return (checkers.transposition_table.size_mb, checkers.evaluation_cache.size_mb)
+
+
+class MemoryLimitTest(unittest.TestCase):
+
+    settings = ('memory_limit_mb', 'memory_reserve_mb', 'memory_processes', 'memory_shrink_rss_kb',
+                'transposition_table', 'evaluation_cache')
+
+    def setUp(self):
+        self.saved = dict((name, getattr(checkers, name)) for name in self.settings)
+        checkers.transposition_table = checkers.TranspositionTable(64)
+        checkers.evaluation_cache = checkers.EvaluationCache(16)
+        checkers.memory_reserve_mb = 32
+        checkers.memory_shrink_rss_kb = 0
+
+    def tearDown(self):
+        for (name, value) in self.saved.items():
+            setattr(checkers, name, value)
+
+    def test_no_limit(self):
+        checkers.fit_memory_limit()
+        self.assertFalse(checkers.check_memory_limit())
+        self.assertEqual(table_sizes_mb(), (64, 16))
+
+    def test_tables_fit_next_to_the_process(self):
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=100 * 1024):
+            checkers.memory_limit_mb = 152
+            checkers.fit_memory_limit()
+        # 152 MB less 100 MB in use and the 32 MB reserve, shared as 64 to 16.
+        self.assertAlmostEqual(sum(table_sizes_mb()), 20)
+        self.assertAlmostEqual(checkers.transposition_table.size_mb, 16)
+
+    def test_tables_fit_in_the_share_of_the_process(self):
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=20 * 1024):
+            checkers.memory_limit_mb = 312
+            checkers.memory_processes = 4
+            checkers.fit_memory_limit()
+        # A quarter of 312 MB, less 20 MB in use and the 32 MB reserve.
+        self.assertAlmostEqual(sum(table_sizes_mb()), 26)
+
+    def test_tables_that_fit_are_kept(self):
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=20 * 1024):
+            checkers.memory_limit_mb = 1024
+            table = checkers.transposition_table
+            checkers.fit_memory_limit()
+        self.assertIs(checkers.transposition_table, table)
+
+    def test_warns_when_memory_cannot_be_measured(self):
+        checkers.memory_limit_mb = 1
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=None):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                checkers.fit_memory_limit()
+        self.assertEqual(len(caught), 1)
+        self.assertIn('memory limit is not applied', str(caught[0].message))
+        self.assertEqual(table_sizes_mb(), (64, 16))
+
+    def test_tables_halved_once_per_growth(self):
+        checkers.memory_limit_mb = 200
+        checkers.memory_processes = 2
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=90 * 1024):
+            self.assertFalse(checkers.check_memory_limit())
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=110 * 1024):
+            self.assertTrue(checkers.check_memory_limit())
+            self.assertEqual(table_sizes_mb(), (32, 8))
+            # Memory that Python keeps after the halving does not halve the tables again.
+            self.assertFalse(checkers.check_memory_limit())
+        with mock.patch.object(checkers, 'current_rss_kb', return_value=120 * 1024):
+            self.assertTrue(checkers.check_memory_limit())
+        self.assertEqual(table_sizes_mb(), (16, 4))
+
+    @unittest.skipIf(checkers.current_rss_kb() is None, 'the resident set size cannot be measured here')
+    def test_parallel_workers_share_the_limit(self):
+        rss_mb = checkers.current_rss_kb() / 1024
+        checkers.memory_limit_mb = 3 * (rss_mb + checkers.memory_reserve_mb + 8)
+        parallel_search = checkers.ParallelSearch(2)
+        try:
+            self.assertEqual(checkers.memory_processes, 3)
+            self.assertLessEqual(sum(table_sizes_mb()), 8.5)
+            for sizes in parallel_search.pool.map(table_sizes_mb, range(4), 1):
+                self.assertLessEqual(sum(sizes), 8.5)
+        finally:
+            parallel_search.close()
+        self.assertEqual(checkers.memory_processes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Tests of the packed position format (see checkers.PositionWriter) and of its
+conversion to and from text corpora.
+
+Run with python -m pytest tests (or python -m unittest discover tests).
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checkers
+import positions
+
+
+def random_position(rng):
+    """
+    :return: A random packed position: up to 12 pieces a side, men never on the
+        row where they would have been crowned, and a random side to move.
+    :rtype: Tuple[int, int, int, int, bool]
+    """
+    squares = rng.sample(range(checkers.num_squares), rng.randint(0, 24))
+    masks = [0, 0, 0, 0]
+    for square in squares:
+        kind = rng.randrange(4)
+        if checkers.promotion_squares[kind] >> square & 1:
+            kind += 1 # Crowned on arrival
+        masks[kind] |= 1 << square
+    return tuple(masks) + (rng.random() < 0.5,)
+
+
+class PositionFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'positions.ckp')
+        rng = random.Random(22)
+        # More than one write buffer and one read chunk.
+        self.positions = [random_position(rng) for index in range(checkers.PositionWriter.buffer_records + 500)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self):
+        with checkers.PositionWriter(self.filename) as writer:
+            for position in self.positions:
+                writer.write(position)
+        self.assertEqual(writer.count, len(self.positions))
+
+    def test_round_trip(self):
+        self.write()
+        self.assertEqual(os.path.getsize(self.filename),
+                         checkers.SortedRecordFile.header.size + len(self.positions) * checkers.position_record.size)
+        self.assertEqual(list(checkers.read_positions(self.filename, chunk_records=1000)), self.positions)
+        position_file = checkers.PositionFile(self.filename)
+        try:
+            self.assertEqual(len(position_file), len(self.positions))
+            for index in (0, 1, 4095, 4096, len(self.positions) - 1, -1):
+                self.assertEqual(position_file[index], self.positions[index])
+            state = position_file.state(7)
+            self.assertEqual(checkers.board_position(state.board, state.red_turn), self.positions[7])
+            with self.assertRaises(IndexError):
+                position_file[len(self.positions)]
+        finally:
+            position_file.close()
+
+    def test_text_round_trip(self):
+        self.write()
+        text_file = os.path.join(self.directory, 'positions.txt')
+        packed_again = os.path.join(self.directory, 'again.ckp')
+        self.assertEqual(positions.unpack(self.filename, text_file), len(self.positions))
+        self.assertEqual(positions.pack([text_file], packed_again), len(self.positions))
+        with open(self.filename, 'rb') as original, open(packed_again, 'rb') as again:
+            self.assertEqual(original.read(), again.read())
+
+    def assert_rejected(self, data, message):
+        with open(self.filename, 'wb') as output_file:
+            output_file.write(data)
+        with self.assertRaises(ValueError) as raised:
+            list(checkers.read_positions(self.filename))
+        self.assertIn(message, str(raised.exception))
+        with self.assertRaises(ValueError) as raised:
+            checkers.PositionFile(self.filename)
+        self.assertIn(message, str(raised.exception))
+
+    def test_truncated_file(self):
+        self.write()
+        with open(self.filename, 'rb') as input_file:
+            data = input_file.read()
+        self.assert_rejected(data[:-1], 'truncated')
+        self.assert_rejected(data + b'\0', 'truncated')
+        self.assert_rejected(data[:10], 'is not a CKPS file')
+
+    def test_wrong_magic(self):
+        self.write()
+        with open(self.filename, 'rb') as input_file:
+            data = input_file.read()
+        self.assert_rejected(b'CKTB' + data[4:], 'is not a CKPS file')
+        header = checkers.SortedRecordFile.header
+        self.assert_rejected(header.pack(checkers.position_magic, 2, 0, 0), 'of version')
+
+    def test_unclosed_writer(self):
+        writer = checkers.PositionWriter(self.filename)
+        for position in self.positions:
+            writer.write(position)
+        writer.flush()
+        self.assertRaises(ValueError, lambda: list(checkers.read_positions(self.filename)))
+        writer.close()
+        self.assertEqual(len(list(checkers.read_positions(self.filename))), len(self.positions))
+
+
+if __name__ == "__main__":
+    unittest.main()
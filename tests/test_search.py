@@ -0,0 +1,428 @@
+"""
+Regression tests of the search: the parallel root search and the optimizations
+of a single search must not change the move chosen or its value.
+
+Run with python -m pytest tests (or python -m unittest discover tests).
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checkers
+
+
+def random_state(rng, max_pieces=6, king_share=0.5):
+    """
+    :return: A random position with a few pieces a side and a random side to move.
+    :rtype: State
+    """
+    squares = [(x, y) for y in range(8) for x in range(8) if (x + y) % 2 == 1]
+    red_count = rng.randint(1, max_pieces)
+    black_count = rng.randint(1, max_pieces)
+    grid = [['.'] * 8 for y in range(8)]
+    for (index, (x, y)) in enumerate(rng.sample(squares, red_count + black_count)):
+        red = index < red_count
+        king = rng.random() < king_share or (red and y == 0) or (not red and y == 7)
+        grid[y][x] = ('R' if king else 'r') if red else ('B' if king else 'b')
+    return checkers.State(checkers.read_from_input(grid), rng.random() < 0.5)
+
+
+def searchable_states(seed, count, max_pieces=6):
+    """
+    :return: Random states with at least two moves and pieces of both sides.
+    :rtype: List[State]
+    """
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        state = random_state(rng, max_pieces)
+        if not state.board.pieces_check_end_game() and len(state.move_finder()[0]) >= 2:
+            states.append(state)
+    return states
+
+
+def serial_search(state, depth):
+    """
+    :return: The best move of a state and its value, from the search in this process.
+    :rtype: Tuple[Move, float]
+    """
+    checkers.clear_search_tables()
+    checkers.search_control.depth_limit = depth
+    checkers.search_control.start_search(state)
+    if state.red_turn:
+        return state.MAX_VALUE(float('-inf'), float('inf'), 1)
+    return state.MIN_VALUE(float('-inf'), float('inf'), 1)
+
+
+def leaf_value(board, red_turn):
+    """
+    :return: The value of a position at the depth limit, found without the
+        evaluation cache: pending jumps are played out before evaluating.
+    :rtype: float
+    """
+    if checkers.quiescence_search and not board.pieces_check_end_game() and board.has_jump(red_turn):
+        values = []
+        for move in checkers.State(board, red_turn).move_finder()[0]:
+            board.make(move)
+            values.append(leaf_value(board, not red_turn))
+            board.unmake(move)
+        return max(values) if red_turn else min(values)
+    return board.evaluation_fcn()
+
+
+def minimax(state, depth, repetitions=True):
+    """
+    Plain minimax with the draw rules of the search, but without pruning, move
+    ordering, tables or caches, and with a new move list at every node.
+
+    :param repetitions: False to not score repeated positions as draws.
+    :type repetitions: bool
+    :return: The value of a state searched to a depth limit.
+    :rtype: float
+    """
+    board = state.board.copy()
+    path = set(state.history)
+    path.add(board.position_key(state.red_turn))
+
+    def value(red_turn, ply, quiet_plies):
+        key = board.position_key(red_turn)
+        if ply > 1 and ((repetitions and key in path) or quiet_plies >= checkers.no_progress_limit):
+            return checkers.draw_value
+        if ply == depth or board.pieces_check_end_game():
+            return leaf_value(board, red_turn)
+        if ply > 1:
+            path.add(key)
+        values = []
+        for move in checkers.State(board, red_turn).move_finder()[0]:
+            board.make(move)
+            values.append(value(not red_turn, ply + 1, 0 if move.irreversible else quiet_plies + 1))
+            board.unmake(move)
+        path.discard(key)
+        if not values:
+            return checkers.neg_utility if red_turn else checkers.utility
+        return max(values) if red_turn else min(values)
+
+    return value(state.red_turn, 1, len(state.history))
+
+
+def root_values(state, depth):
+    """
+    :return: The minimax value of every move of a state, by move key.
+    :rtype: Dict[int, float]
+    """
+    return dict((move.key, minimax(state.play(move), depth - 1)) for move in state.move_finder()[0])
+
+
+def play_path(state, *path):
+    """
+    :param path: The squares the piece visits, as (x, y) coordinates.
+    :return: The state after the move of the side to move along a path.
+    :rtype: State
+    """
+    for move in state.move_finder()[0]:
+        if [checkers.square_coords[square] for square in move.path] == list(path):
+            return state.play(move)
+    raise AssertionError('no move along {}'.format(path))
+
+
+class SearchTestCase(unittest.TestCase):
+    """
+    Runs every test with exact settings and restores the module settings after it.
+    """
+
+    settings = ('selective_search', 'quiescence_search', 'static_ordering', 'batch_evaluation',
+                'no_progress_limit', 'draw_value', 'transposition_table', 'evaluation_cache')
+
+    def setUp(self):
+        self.saved = dict((name, getattr(checkers, name)) for name in self.settings)
+        checkers.selective_search = False
+        checkers.clear_search_tables()
+
+    def tearDown(self):
+        for (name, value) in self.saved.items():
+            setattr(checkers, name, value)
+
+
+class ParallelSearchTest(SearchTestCase):
+
+    depth = 6
+
+    def setUp(self):
+        super().setUp()
+        self.parallel_search = None
+
+    def tearDown(self):
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+        super().tearDown()
+
+    def parallel_result(self, state, start_method=None):
+        # The workers are started once the settings of the test are made.
+        if self.parallel_search is None:
+            self.parallel_search = checkers.ParallelSearch(3, start_method)
+        checkers.clear_search_tables()
+        return self.parallel_search.search(checkers.State(state.board.copy(), state.red_turn), self.depth)
+
+    def test_same_move_and_value_as_serial(self):
+        for state in searchable_states(12, 80):
+            (serial_move, serial_value) = serial_search(state, self.depth)
+            (parallel_move, parallel_value) = self.parallel_result(state)
+            self.assertEqual(parallel_value, serial_value, state.board.grid)
+            self.assertEqual(parallel_move.key, serial_move.key, state.board.grid)
+
+    def test_workers_take_the_settings_of_this_process(self):
+        # Spawned workers import the module afresh instead of inheriting its settings.
+        checkers.no_progress_limit = 4
+        for start_method in multiprocessing.get_all_start_methods():
+            with self.subTest(start_method=start_method):
+                self.parallel_search = checkers.ParallelSearch(2, start_method)
+                for state in searchable_states(6, 40):
+                    (serial_move, serial_value) = serial_search(state, self.depth)
+                    (parallel_move, parallel_value) = self.parallel_result(state)
+                    self.assertEqual(parallel_value, serial_value, state.board.grid)
+                    self.assertEqual(parallel_move.key, serial_move.key, state.board.grid)
+                self.parallel_search.close()
+                self.parallel_search = None
+
+    def test_win_found_before_a_blocked_side(self):
+        # Red wins by blocking black; the workers used to open empty windows once the
+        # win was found and fail on the node without moves.
+        grid = ['........',
+                '........',
+                '........',
+                '........',
+                '...r.R..',
+                '..b.....',
+                '.r......',
+                'r.r.r...']
+        state = checkers.State(checkers.read_from_input(grid), True)
+        (serial_move, serial_value) = serial_search(state, self.depth)
+        (parallel_move, parallel_value) = self.parallel_result(state)
+        self.assertEqual(parallel_value, serial_value)
+        self.assertEqual(parallel_move.key, serial_move.key)
+
+
+class PruningTest(SearchTestCase):
+    """
+    The exact search must find the minimax value. The selective search (late move
+    reductions and futility pruning) may settle for a slightly worse move, but
+    must not miss a forced win.
+    """
+
+    depth = 6
+
+    def setUp(self):
+        super().setUp()
+        self.states = searchable_states(2, 80)
+
+    def test_exact_search_finds_the_minimax_value(self):
+        for state in self.states:
+            (move, value) = serial_search(state, self.depth)
+            values = root_values(state, self.depth)
+            best = max(values.values()) if state.red_turn else min(values.values())
+            self.assertAlmostEqual(value, best, msg=state.board.grid)
+            self.assertEqual(values[move.key], best, state.board.grid)
+
+    def test_selective_search_keeps_forced_wins(self):
+        checkers.selective_search = True
+        wins = 0
+        for state in self.states:
+            (move, value) = serial_search(state, self.depth)
+            values = root_values(state, self.depth)
+            best = max(values.values()) if state.red_turn else min(values.values())
+            if abs(best) == checkers.utility:
+                wins += 1
+                self.assertEqual(values[move.key], best, state.board.grid)
+            elif values[move.key] != best:
+                loss = best - values[move.key] if state.red_turn else values[move.key] - best
+                self.assertLessEqual(loss, checkers.futility_margin, state.board.grid)
+        self.assertGreater(wins, 0)
+
+
+class EvaluationCacheTest(SearchTestCase):
+    """
+    Leaf values from the evaluation cache, including bounds and values left by
+    earlier searches, must not change the result of a search.
+    """
+
+    depth = 6
+
+    def search_all(self, states, clear=True):
+        results = []
+        for state in states:
+            if clear:
+                checkers.clear_search_tables()
+            else:
+                checkers.transposition_table.clear()
+                checkers.move_history.clear()
+            checkers.search_control.depth_limit = self.depth
+            checkers.search_control.start_search(state)
+            if state.red_turn:
+                (move, value) = state.MAX_VALUE(float('-inf'), float('inf'), 1)
+            else:
+                (move, value) = state.MIN_VALUE(float('-inf'), float('inf'), 1)
+            results.append((move.key, value))
+        return results
+
+    def test_same_results_with_and_without_the_cache(self):
+        # Crowded positions, where many leaves have a jump pending and get bounds.
+        states = searchable_states(3, 60, 12)
+        for selective_search in (False, True):
+            checkers.selective_search = selective_search
+            checkers.evaluation_cache = checkers.EvaluationCache(0)
+            expected = self.search_all(states)
+            # The smallest cache holds a few entries, so that most stores replace one.
+            for size_mb in (checkers.eval_cache_mb, 0.002):
+                checkers.evaluation_cache = checkers.EvaluationCache(size_mb)
+                self.assertEqual(self.search_all(states), expected, (selective_search, size_mb))
+                self.assertEqual(self.search_all(states, clear=False), expected, (selective_search, size_mb))
+
+    def test_bounds_only_answer_the_windows_they_decide(self):
+        cache = checkers.EvaluationCache()
+        cache.store(1, 1.0, checkers.lower_bound)
+        cache.store(2, -1.0, checkers.upper_bound)
+        self.assertEqual(cache.probe(1, 0.0, 0.5), 1.0)
+        self.assertIsNone(cache.probe(1, 0.0, 2.0))
+        self.assertEqual(cache.probe(2, -0.5, 0.0), -1.0)
+        self.assertIsNone(cache.probe(2, -2.0, 0.0))
+        self.assertIsNone(cache.probe(3, float('-inf'), float('inf')))
+
+    def test_clock_keeps_referenced_entries(self):
+        cache = checkers.EvaluationCache(3 * checkers.EvaluationCache.entry_bytes / (1024 * 1024))
+        self.assertEqual(cache.size, 3)
+        for key in (1, 2, 3):
+            cache.store(key, float(key))
+        cache.probe(1, float('-inf'), float('inf'))
+        cache.store(4, 4.0)
+        self.assertEqual(cache.probe(1, float('-inf'), float('inf')), 1.0)
+        self.assertIsNone(cache.probe(2, float('-inf'), float('inf')))
+        self.assertEqual(cache.probe(4, float('-inf'), float('inf')), 4.0)
+
+
+class MoveBufferTest(SearchTestCase):
+    """
+    The search generates the moves of each ply into a list kept for that ply.
+    Moves left in the lists by other positions and searches must not leak into
+    the moves of the next ones.
+    """
+
+    def test_reused_list_holds_the_same_moves(self):
+        buffer = []
+        for state in searchable_states(4, 200, 12):
+            (moves, jumping) = state.move_finder()
+            self.assertEqual(state.move_finder(buffer), (buffer, jumping))
+            self.assertEqual([move.key for move in buffer], [move.key for move in moves], state.board.grid)
+
+    def test_searches_in_a_row_find_the_minimax_value(self):
+        # The tables are cleared but the move lists are not.
+        for (depth, state) in zip([6, 4, 5, 3] * 10, searchable_states(5, 40, 8)):
+            (move, value) = serial_search(state, depth)
+            values = root_values(state, depth)
+            best = max(values.values()) if state.red_turn else min(values.values())
+            self.assertAlmostEqual(value, best, msg=state.board.grid)
+            self.assertEqual(values[move.key], best, state.board.grid)
+
+
+class DrawTest(SearchTestCase):
+    """
+    Draws by repetition and by the no-progress rule, in the game and in the search.
+    """
+
+    # Two kings far apart, with a man each that can move.
+    grid = ['........',
+            '..b...B.',
+            '........',
+            '........',
+            '........',
+            '........',
+            '.R......',
+            '......r.']
+
+    def setUp(self):
+        super().setUp()
+        self.state = checkers.State(checkers.read_from_input(self.grid), True)
+
+    def test_threefold_repetition(self):
+        state = self.state
+        for repetition in range(2):
+            self.assertFalse(state.is_draw())
+            state = play_path(state, (1, 6), (2, 5))
+            state = play_path(state, (6, 1), (5, 2))
+            state = play_path(state, (2, 5), (1, 6))
+            state = play_path(state, (5, 2), (6, 1))
+        # The starting position has now occurred three times.
+        self.assertEqual(len(state.history), 8)
+        self.assertTrue(state.is_draw())
+        self.assertEqual(checkers.game_result(state), 'draw')
+
+    def test_no_progress_counter(self):
+        checkers.no_progress_limit = 4
+        state = play_path(self.state, (1, 6), (2, 5))
+        state = play_path(state, (6, 1), (5, 2))
+        state = play_path(state, (2, 5), (3, 4))
+        self.assertEqual(len(state.history), 3)
+        self.assertFalse(state.is_draw())
+        # A man moving resets the count.
+        moved = play_path(state, (2, 1), (1, 2))
+        self.assertEqual(moved.history, ())
+        self.assertFalse(moved.is_draw())
+        state = play_path(state, (5, 2), (4, 1))
+        self.assertTrue(state.is_draw())
+        self.assertEqual(checkers.game_result(state), 'draw')
+
+    def test_capture_resets_the_no_progress_counter(self):
+        state = play_path(self.state, (1, 6), (2, 5))
+        state = play_path(state, (6, 1), (5, 2))
+        state = play_path(state, (2, 5), (3, 4))
+        state = play_path(state, (5, 2), (4, 3))
+        self.assertEqual(len(state.history), 4)
+        # The king that came next to the red king is captured.
+        state = play_path(state, (3, 4), (5, 2))
+        self.assertEqual(state.history, ())
+        self.assertFalse(state.board.black_kings)
+
+    def test_search_scores_no_progress_as_a_draw(self):
+        # Red is a king up, but one quiet move away from the no-progress limit: a king
+        # move draws, so the man has to move.
+        grid = ['........',
+                '........',
+                '...b....',
+                '........',
+                '........',
+                'R.......',
+                '........',
+                'R.....r.']
+        state = checkers.State(checkers.read_from_input(grid), True, 0,
+                               tuple(range(checkers.no_progress_limit - 1)))
+        (move, value) = serial_search(state, 4)
+        self.assertFalse(move.is_king)
+        self.assertGreater(value, checkers.draw_value)
+        self.assertAlmostEqual(value, minimax(state, 4))
+        for move in state.move_finder()[0]:
+            self.assertEqual(state.play(move).is_draw(), move.is_king)
+
+    def test_search_scores_repetitions_in_the_tree_as_draws(self):
+        # Positions with kings only, where repeating positions within the search
+        # changes the value. The transposition table reuses values whichever line
+        # reached a position, so without it the search must match exactly.
+        checkers.transposition_table = checkers.TranspositionTable(0)
+        checkers.draw_value = 0.75
+        rng = random.Random(7)
+        repeated = 0
+        while repeated < 5:
+            state = random_state(rng, 3, king_share=1)
+            if state.board.pieces_check_end_game() or len(state.move_finder()[0]) < 2:
+                continue
+            value = minimax(state, 5)
+            if value == minimax(state, 5, repetitions=False):
+                continue
+            repeated += 1
+            self.assertAlmostEqual(serial_search(state, 5)[1], value, msg=state.board.grid)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests of the solver service, through a connection as a client sees it.
+
+Run with python -m pytest tests (or python -m unittest discover tests).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checkers
+import service
+
+
+finished_grid = ['........'] * 7 + ['....R...']
+
+
+def exchange(solver, requests):
+    """
+    Sends requests to a service on a local port, one line each.
+
+    :return: The decoded answer of each request.
+    :rtype: List[Dict]
+    """
+    async def run():
+        server = await asyncio.start_server(solver.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        (reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+        answers = []
+        for request in requests:
+            writer.write((json.dumps(request) + "\n").encode())
+            await writer.drain()
+            answers.append(json.loads(await asyncio.wait_for(reader.readline(), 30)))
+        writer.close()
+        # The service closes its end once it reads the end of the stream.
+        await reader.read()
+        server.close()
+        await server.wait_closed()
+        return answers
+    return asyncio.run(run())
+
+
+class SolverServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_depth = checkers.depth_limit
+        self.solver = service.SolverService(depth=4)
+
+    def tearDown(self):
+        checkers.depth_limit = self.saved_depth
+
+    def test_finished_game(self):
+        answers = exchange(self.solver, [{'grid': finished_grid, 'red_turn': True, 'id': 1},
+                                         {'grid': finished_grid, 'red_turn': False, 'mode': 'line', 'id': 2}])
+        self.assertEqual(answers, [{'move': None, 'result': 'red', 'id': 1},
+                                   {'line': [], 'result': 'red', 'id': 2}])
+        self.assertEqual(self.solver.counters['errors'], 0)
+
+    def test_move(self):
+        grid = ['........', '........', '...b....', '..r.....', '........', '........', '........', '........']
+        [answer] = exchange(self.solver, [{'grid': grid, 'red_turn': True}])
+        self.assertEqual(answer['move'], [[2, 3], [4, 1]])
+        self.assertEqual(answer['grid'][2], '........')
+
+    def test_invalid_request(self):
+        answers = exchange(self.solver, [{'grid': finished_grid, 'red_turn': 'false'}, {'grid': ['........']}])
+        for answer in answers:
+            self.assertTrue(answer['error'].startswith('invalid request'), answer)
+        self.assertEqual(self.solver.counters['errors'], 2)
+
+    def test_solver_failure_is_answered(self):
+        grid = checkers.opening_grid
+        with mock.patch.object(checkers.State, 'choose_move', side_effect=RuntimeError('broken')):
+            answers = exchange(self.solver, [{'grid': grid, 'id': 1}, {'command': 'stats'}])
+        self.assertEqual(answers[0], {'error': 'internal error: RuntimeError: broken', 'id': 1})
+        self.assertEqual(answers[1]['errors'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()